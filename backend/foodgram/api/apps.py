@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .metrics import instrument_connections
+        if 'api.metrics.PerformanceMiddleware' in settings.MIDDLEWARE:
+            instrument_connections()
@@ -0,0 +1,55 @@
+"""Асинхронные представления для чтения в режиме ASGI (SERVER_MODE=asgi).
+
+Запросы обрабатывают те же ViewSet, что и в WSGI, поэтому аутентификация,
+ограничение частоты, ETag, чтение с реплики и метрики не отличаются.
+Django 3.2 выполняет синхронные представления в одном общем потоке
+процесса, а безопасные запросы здесь выполняются в пуле потоков
+(thread_sensitive=False) и не ждут друг друга. Изменяющие запросы
+остаются в общем потоке, как у остальных маршрутов.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from rest_framework.permissions import SAFE_METHODS
+
+from .views import IngredientViewSet, RecipeViewSet, TagViewSet
+
+
+def run_view(view, request, *args, **kwargs):
+    """Выполняет представление и рендерит ответ в потоке из пула.
+
+    Соединения с БД в Django 3.2 принадлежат потоку, поэтому закрыть
+    устаревшие можно только здесь, а не в сигналах начала и конца
+    запроса.
+    """
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def as_async(viewset, actions):
+    view = viewset.as_view(actions)
+
+    @wraps(view)
+    async def async_view(request, *args, **kwargs):
+        return await sync_to_async(
+            run_view, thread_sensitive=request.method not in SAFE_METHODS
+        )(view, request, *args, **kwargs)
+    return async_view
+
+
+tag_list = as_async(TagViewSet, {'get': 'list'})
+ingredient_list = as_async(IngredientViewSet, {'get': 'list'})
+recipe_list = as_async(RecipeViewSet, {'get': 'list', 'post': 'create'})
+recipe_detail = as_async(RecipeViewSet, {
+    'get': 'retrieve',
+    'put': 'update',
+    'patch': 'partial_update',
+    'delete': 'destroy',
+})
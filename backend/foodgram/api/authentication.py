@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+CACHE_PREFIX = 'auth-token:'
+
+
+class LocalLRUCache:
+    """Небольшой LRU-кеш в памяти процесса с временем жизни записей."""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self.data[key]
+                return None
+            self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = (value, time.monotonic() + self.ttl)
+            self.data.move_to_end(key)
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+
+local_cache = LocalLRUCache(
+    settings.AUTH_TOKEN_LOCAL_CACHE_SIZE,
+    settings.AUTH_TOKEN_LOCAL_CACHE_TTL
+)
+
+
+def invalidate_tokens(keys):
+    keys = list(keys)
+    for key in keys:
+        local_cache.delete(key)
+    cache.delete_many([CACHE_PREFIX + key for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к БД на каждый запрос.
+
+    Пара (user, token) ищется сначала в локальном LRU процесса, затем
+    в общем кеше Django и только потом в БД. Записи сбрасываются
+    сигналами при удалении токена и при сохранении пользователя
+    (смена пароля, деактивация). Локальный кеш других процессов
+    живёт не дольше AUTH_TOKEN_LOCAL_CACHE_TTL. Если кеш Django не
+    общий для процессов (SHARED_CACHE), он не используется: сброс из
+    одного процесса не дошёл бы до остальных.
+    """
+
+    def authenticate_credentials(self, key):
+        credentials = local_cache.get(key)
+        if credentials is None:
+            credentials = self.get_shared(key)
+            local_cache.set(key, credentials)
+        if not credentials[0].is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        return credentials
+
+    def get_shared(self, key):
+        if not settings.SHARED_CACHE:
+            return super().authenticate_credentials(key)
+        credentials = cache.get(CACHE_PREFIX + key)
+        if credentials is None:
+            credentials = super().authenticate_credentials(key)
+            cache.set(
+                CACHE_PREFIX + key,
+                credentials,
+                settings.AUTH_TOKEN_CACHE_TTL
+            )
+        return credentials
@@ -0,0 +1,107 @@
+import hashlib
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from recipes.models import Recipe
+from rest_framework.response import Response
+
+PREFIX = 'anon-recipes'
+LIST_VERSION = 'list'
+TAGS_VERSION = 'tags'
+INGREDIENTS_VERSION = 'ingredients'
+
+
+def get_version(name):
+    return cache.get_or_set(f'{PREFIX}-version:{name}', 1, None)
+
+
+def bump_version(name):
+    try:
+        cache.incr(f'{PREFIX}-version:{name}')
+    except ValueError:
+        cache.set(f'{PREFIX}-version:{name}', 1, None)
+
+
+def invalidate_recipes(recipe_ids):
+    """Сбрасывает кеш списков и страниц перечисленных рецептов."""
+    bump_version(LIST_VERSION)
+    for recipe_id in set(recipe_ids):
+        bump_version(recipe_id)
+
+
+def touch_recipes(recipe_ids):
+    """Обновляет updated_at рецептов после изменения связанных данных.
+
+    Кеш сбрасывается после коммита: иначе параллельный запрос успел бы
+    закешировать ещё не закоммиченное состояние под новой версией.
+    """
+    recipe_ids = list(recipe_ids)
+    Recipe.objects.filter(id__in=recipe_ids).update(updated_at=timezone.now())
+    transaction.on_commit(lambda: invalidate_recipes(recipe_ids))
+
+
+def query_digest(request):
+    """Хеш схемы, хоста и параметров: в ответе есть абсолютные ссылки."""
+    params = sorted(
+        (key, sorted(values))
+        for key, values in request.query_params.lists()
+    )
+    query = '{}://{}?{}'.format(
+        request.scheme, request.get_host(), urlencode(params, doseq=True)
+    )
+    return hashlib.md5(query.encode()).hexdigest()
+
+
+def list_key(request, **kwargs):
+    return f'{PREFIX}:list:{get_version(LIST_VERSION)}:{query_digest(request)}'
+
+
+def detail_key(request, pk, **kwargs):
+    try:
+        pk = Recipe._meta.pk.to_python(pk)
+    except ValidationError:
+        return None
+    return f'{PREFIX}:{pk}:{get_version(pk)}:{query_digest(request)}'
+
+
+def get_or_render(key, render):
+    """Отдаёт ответ из кеша, при устаревании пересчитывает его один раз.
+
+    Пока один запрос пересчитывает устаревшую запись, остальные получают
+    прежние данные (stale-while-revalidate).
+    """
+    ttl = settings.ANON_CACHE_TTL
+    stale = settings.ANON_CACHE_STALE
+    entry = cache.get(key)
+    if entry is not None:
+        data, fresh_until = entry
+        if fresh_until > time.time() or not cache.add(
+                f'{key}:lock', 1, stale or ttl):
+            return Response(data)
+    response = render()
+    if response.status_code == 200:
+        cache.set(key, (response.data, time.time() + ttl), ttl + stale)
+    return response
+
+
+def cache_anonymous(key_func):
+    """Кеширует данные ответа для анонимных пользователей."""
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            key = None
+            if request.user.is_anonymous and settings.ANON_CACHE_TTL:
+                key = key_func(request, **kwargs)
+            if key is None:
+                return method(self, request, *args, **kwargs)
+            return get_or_render(
+                key, lambda: method(self, request, *args, **kwargs)
+            )
+        return wrapper
+    return decorator
@@ -0,0 +1,66 @@
+"""Сжатие ответов brotli или gzip по заголовку Accept-Encoding.
+
+Ответы короче COMPRESSION_MIN_SIZE и уже сжатые форматы (архивы,
+картинки) не сжимаются. Brotli используется, если установлен пакет
+brotli и клиент его принимает; потоковые ответы и остальные клиенты
+получают gzip.
+"""
+import re
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ACCEPTS_BROTLI = re.compile(r'\bbr\b')
+
+COMPRESSED_TYPES = {
+    'application/gzip',
+    'application/x-gzip',
+    'application/zip',
+    'image/gif',
+    'image/jpeg',
+    'image/png',
+    'image/webp',
+}
+
+
+def is_compressed(response):
+    content_type = response.get('Content-Type', '')
+    return content_type.split(';')[0].strip().lower() in COMPRESSED_TYPES
+
+
+class CompressionMiddleware(GZipMiddleware):
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding') or is_compressed(response):
+            return response
+        if (
+            not response.streaming
+            and len(response.content) < settings.COMPRESSION_MIN_SIZE
+        ):
+            return response
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if (
+            brotli is None
+            or response.streaming
+            or not ACCEPTS_BROTLI.search(accept_encoding)
+        ):
+            return super().process_response(request, response)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        compressed = brotli.compress(
+            response.content, quality=settings.COMPRESSION_BROTLI_QUALITY
+        )
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
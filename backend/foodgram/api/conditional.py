@@ -0,0 +1,116 @@
+"""Условные GET-запросы к спискам и страницам объектов.
+
+ETag считается по версиям в кеше, которые увеличиваются при изменении
+данных (те же версии сбрасывают кеш ответов анонимам), без запросов к
+БД. Для авторизованных пользователей в него входит ещё версия
+избранного, корзины и подписок, от которых зависят флаги is_favorited,
+is_in_shopping_cart и is_subscribed. Если ETag совпал с If-None-Match,
+ответ 304 отдаётся до вызова сериализатора.
+
+Версии должны быть видны всем процессам, поэтому ETag отдаётся только с
+общим кешем (SHARED_CACHE): с LocMemCache версию увеличил бы только
+процесс, изменивший данные, а остальные отвечали бы 304 на устаревший
+ETag.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from rest_framework.exceptions import APIException
+
+from . import membership
+
+EPOCH_KEY = 'etag-epoch'
+
+
+class NotModified(APIException):
+    """Прерывает обработку запроса готовым ответом 304."""
+
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+def make_etag(*parts):
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+class ConditionalGetMixin:
+    """Отвечает 304 на GET/HEAD, если данные не изменились.
+
+    Действия перечислены в conditional_actions, версии данных ответа
+    возвращает get_versions(); если она вернула None, ETag не отдаётся.
+    В ETag входит ещё метка, которая
+    меняется после очистки кеша: иначе версии начались бы заново и
+    совпали бы с версиями старых данных.
+    """
+
+    conditional_actions = ('list', 'retrieve')
+
+    def get_versions(self):
+        return None
+
+    def get_stamp(self, request):
+        if not settings.SHARED_CACHE:
+            return None
+        try:
+            versions = self.get_versions()
+        except (ValueError, TypeError, ValidationError):
+            return None
+        if versions is None:
+            return None
+        parts = [
+            request.get_full_path(),
+            cache.get_or_set(EPOCH_KEY, time.time_ns(), None),
+            *versions,
+        ]
+        if request.user.is_authenticated:
+            parts += [
+                request.user.pk,
+                membership.get_version(request.user.pk),
+            ]
+        return make_etag(*parts)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag = None
+        if (
+            request.method not in ('GET', 'HEAD')
+            or self.action not in self.conditional_actions
+        ):
+            return
+        self.etag = self.get_stamp(request)
+        if self.etag is None:
+            return
+        response = get_conditional_response(
+            request._request, etag=self.etag
+        )
+        if response is not None:
+            raise NotModified(response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        etag = getattr(self, 'etag', None)
+        if etag is None or response.status_code not in (200, 304):
+            return response
+        response['ETag'] = etag
+        if request.user.is_authenticated:
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            patch_cache_control(
+                response, public=True, max_age=0, must_revalidate=True
+            )
+        patch_vary_headers(response, ('Authorization',))
+        return response
@@ -0,0 +1,107 @@
+"""Потоковая выгрузка данных пользователя.
+
+Данные отдаются строками NDJSON с полем type: user, recipe, favorite,
+shopping_cart, subscription. В ZIP-архиве строки лежат в data.ndjson,
+а картинки рецептов — в media/ по тем же путям, что и в MEDIA_ROOT.
+"""
+import json
+import zipfile
+from datetime import datetime
+
+from django.core.files.storage import default_storage
+from recipes.exchange import export_queryset, iter_chunks, recipe_to_dict
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscription
+
+CHUNK_SIZE = 500
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+def dump(data):
+    return json.dumps(data, ensure_ascii=False) + '\n'
+
+
+def user_records(user, images=None):
+    """Строки выгрузки; пути картинок рецептов добавляются в images."""
+    yield dump({
+        'type': 'user',
+        'email': user.email,
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'date_joined': user.date_joined.isoformat(),
+    })
+    recipes = export_queryset().filter(author=user)
+    for chunk in iter_chunks(recipes, CHUNK_SIZE):
+        for recipe in chunk:
+            if images is not None and recipe.image:
+                images.append(recipe.image.name)
+            yield dump({'type': 'recipe', **recipe_to_dict(recipe)})
+    for record_type, model in (
+        ('favorite', Favorite),
+        ('shopping_cart', ShoppingCart),
+    ):
+        rows = model.objects.filter(user=user).order_by('id').values_list(
+            'recipe_id', 'recipe__name', 'recipe__author__email'
+        )
+        for recipe_id, name, author in rows.iterator(chunk_size=CHUNK_SIZE):
+            yield dump({
+                'type': record_type,
+                'recipe': {'id': recipe_id, 'name': name, 'author': author},
+            })
+    authors = Subscription.objects.filter(user=user).order_by(
+        'id'
+    ).values_list('author__email', 'author__username')
+    for email, username in authors.iterator(chunk_size=CHUNK_SIZE):
+        yield dump({
+            'type': 'subscription',
+            'author': {'email': email, 'username': username},
+        })
+
+
+def ndjson_stream(user):
+    for line in user_records(user):
+        yield line.encode()
+
+
+class ZipBuffer:
+    """Файлоподобный буфер, из которого архив отдаётся по частям."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def zip_stream(user):
+    buffer = ZipBuffer()
+    images = []
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        with archive.open('data.ndjson', 'w') as data:
+            for line in user_records(user, images):
+                data.write(line.encode())
+                if len(buffer.chunks) > 16:
+                    yield buffer.pop()
+        for name in sorted(set(images)):
+            if not default_storage.exists(name):
+                continue
+            info = zipfile.ZipInfo(
+                f'media/{name}', datetime.now().timetuple()[:6]
+            )
+            with default_storage.open(name) as source:
+                with archive.open(info, 'w') as target:
+                    for chunk in source.chunks(FILE_CHUNK_SIZE):
+                        target.write(chunk)
+                        yield buffer.pop()
+        yield buffer.pop()
+    yield buffer.pop()
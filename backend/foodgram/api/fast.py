@@ -0,0 +1,110 @@
+"""Сборка ответов из строк .values() в обход полей сериализаторов.
+
+Результат совпадает с выводом TagSerializer, RecipeShowSerializer и
+RecipeListRetrieveSerializer (без флагов пользователя); это проверяет
+FastSerializerParityTests, выигрыш замеряет команда
+benchmark_serializers.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db.models import QuerySet
+from recipes.models import IngredientRecipe, Recipe
+
+User = get_user_model()
+
+TAG_FIELDS = ('id', 'name', 'color', 'slug')
+AUTHOR_FIELDS = ('email', 'id', 'username', 'first_name', 'last_name')
+RECIPE_SHOW_FIELDS = ('id', 'name', 'image', 'cooking_time')
+
+
+def image_url(name, request):
+    if not name:
+        return None
+    url = default_storage.url(name)
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def decimal_str(value):
+    if value is None:
+        return None
+    return '{:f}'.format(value.quantize(Decimal('0.01')))
+
+
+def float_or_none(value):
+    return None if value is None else float(value)
+
+
+def tag_rows(queryset):
+    return list(queryset.values(*TAG_FIELDS))
+
+
+def recipe_show_rows(data, request=None):
+    if isinstance(data, QuerySet):
+        rows = data.values(*RECIPE_SHOW_FIELDS)
+    else:
+        rows = (
+            {'id': recipe.id, 'name': recipe.name,
+             'image': recipe.image.name, 'cooking_time': recipe.cooking_time}
+            for recipe in data
+        )
+    return [
+        {'id': row['id'], 'name': row['name'],
+         'image': image_url(row['image'], request),
+         'cooking_time': row['cooking_time']}
+        for row in rows
+    ]
+
+
+def recipe_fragments(recipes, request=None):
+    """Части рецептов, не зависящие от пользователя, тремя запросами."""
+    recipe_ids = [recipe.id for recipe in recipes]
+    tags = defaultdict(list)
+    for row in Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('tag_id').values(
+        'recipe_id', *(f'tag__{field}' for field in TAG_FIELDS)
+    ):
+        tags[row['recipe_id']].append(
+            {field: row[f'tag__{field}'] for field in TAG_FIELDS}
+        )
+    ingredients = defaultdict(list)
+    for row in IngredientRecipe.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('id').values(
+        'recipe_id', 'ingredient_id', 'ingredient__name',
+        'ingredient__measurement_unit', 'amount'
+    ):
+        ingredients[row['recipe_id']].append({
+            'id': row['ingredient_id'],
+            'name': row['ingredient__name'],
+            'measurement_unit': row['ingredient__measurement_unit'],
+            'amount': row['amount'],
+        })
+    authors = {
+        row['id']: row for row in User.objects.filter(
+            id__in={recipe.author_id for recipe in recipes}
+        ).values(*AUTHOR_FIELDS)
+    }
+    return {
+        recipe.id: {
+            'id': recipe.id,
+            'tags': tags[recipe.id],
+            'author': dict(authors[recipe.author_id]),
+            'ingredients': ingredients[recipe.id],
+            'name': recipe.name,
+            'image': image_url(recipe.image.name, request),
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'calories': float_or_none(recipe.calories),
+            'proteins': float_or_none(recipe.proteins),
+            'fats': float_or_none(recipe.fats),
+            'carbohydrates': float_or_none(recipe.carbohydrates),
+            'cost': decimal_str(recipe.cost),
+        }
+        for recipe in recipes
+    }
@@ -13,10 +13,19 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.NumberFilter(
         method='filter_is_in_shopping_cart'
     )
+    min_calories = filters.NumberFilter(
+        field_name='calories', lookup_expr='gte'
+    )
+    max_calories = filters.NumberFilter(
+        field_name='calories', lookup_expr='lte'
+    )
+    min_cost = filters.NumberFilter(field_name='cost', lookup_expr='gte')
+    max_cost = filters.NumberFilter(field_name='cost', lookup_expr='lte')
 
     class Meta:
         model = Recipe
-        fields = ['tags', 'author', 'is_favorited', 'is_in_shopping_cart', ]
+        fields = ['tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+                  'min_calories', 'max_calories', 'min_cost', 'max_cost', ]
 
     def filter_is_favorited(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
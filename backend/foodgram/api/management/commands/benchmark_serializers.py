@@ -0,0 +1,77 @@
+import time
+
+from api.fast import tag_rows
+from api.renderers import FastJSONRenderer
+from api.serializers import (RecipeListRetrieveSerializer,
+                             RecipeShowSerializer, TagSerializer)
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.test.client import RequestFactory
+from recipes.models import Recipe, Tag
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ("Compares regular and fast serializers: checks that the JSON "
+            "is byte-identical and reports CPU time per request.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=6,
+                            help="recipes per page")
+        parser.add_argument("--repeat", type=int, default=50)
+        parser.add_argument("--user", type=str,
+                            help="email of the viewer, anonymous if empty")
+
+    def get_request(self, email):
+        factory = RequestFactory(SERVER_NAME=settings.ALLOWED_HOSTS[0])
+        request = Request(factory.get('/api/recipes/'))
+        request.user = (
+            User.objects.get(email=email) if email else AnonymousUser()
+        )
+        return request
+
+    def handle(self, *args, **options):
+        request = self.get_request(options["user"])
+        limit = options["limit"]
+        cases = {
+            'recipes': lambda: RecipeListRetrieveSerializer(
+                list(Recipe.objects.order_by('-id')[:limit]),
+                many=True, context={'request': request}
+            ).data,
+            'recipes_short': lambda: RecipeShowSerializer(
+                Recipe.objects.order_by('-id')[:limit],
+                many=True, context={'request': request}
+            ).data,
+            'tags': lambda: (
+                tag_rows(Tag.objects.all()) if settings.FAST_SERIALIZERS
+                else TagSerializer(Tag.objects.all(), many=True).data
+            ),
+        }
+        failed = False
+        for name, build in cases.items():
+            results = {}
+            for fast, renderer in ((False, JSONRenderer()),
+                                   (True, FastJSONRenderer())):
+                with override_settings(FAST_SERIALIZERS=fast,
+                                       RECIPE_FRAGMENT_CACHE_TTL=0):
+                    start = time.process_time()
+                    for _ in range(options["repeat"]):
+                        body = renderer.render(build())
+                    elapsed = time.process_time() - start
+                results[fast] = (body, elapsed / options["repeat"] * 1000)
+            identical = results[False][0] == results[True][0]
+            failed = failed or not identical
+            self.stdout.write(
+                f"{name}: regular {results[False][1]:.2f} ms, "
+                f"fast {results[True][1]:.2f} ms, "
+                f"saved {results[False][1] - results[True][1]:.2f} ms, "
+                f"identical output: {identical}"
+            )
+        if failed:
+            raise CommandError("Fast serializers output differs")
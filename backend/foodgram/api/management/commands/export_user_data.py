@@ -0,0 +1,26 @@
+from api.export import ndjson_stream, zip_stream
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ("Exports a user's recipes, favorites, shopping cart and "
+            "subscriptions as NDJSON or as a ZIP with recipe images.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--email", type=str, required=True)
+        parser.add_argument("--path", type=str, required=True,
+                            help="output file")
+        parser.add_argument("--zip", action="store_true",
+                            help="write a ZIP archive with images")
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(email=options["email"]).first()
+        if user is None:
+            raise CommandError(f"Unknown user {options['email']}")
+        stream = zip_stream(user) if options["zip"] else ndjson_stream(user)
+        with open(options["path"], "wb") as output:
+            for chunk in stream:
+                output.write(chunk)
@@ -0,0 +1,14 @@
+from api.profiling import make_token
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = ("Prints a signed value for the X-Profile header. It stays "
+            "valid for PROFILING_TOKEN_MAX_AGE seconds.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_token())
+        self.stderr.write(
+            f"valid for {settings.PROFILING_TOKEN_MAX_AGE} seconds"
+        )
@@ -0,0 +1,99 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscription
+
+SETS = {
+    'favorites': (Favorite, 'user_id', 'recipe_id'),
+    'shopping_cart': (ShoppingCart, 'user_id', 'recipe_id'),
+    'subscriptions': (Subscription, 'user_id', 'author_id'),
+}
+
+
+def version_key(user_id):
+    return f'memberships-version:{user_id}'
+
+
+def get_version(user_id):
+    """Версия множеств пользователя.
+
+    Новая версия начинается со времени, а не с 1: если ключ вытеснен из
+    кеша, прежние номера не повторятся и старые множества не вернутся.
+    """
+    return cache.get_or_set(version_key(user_id), time.time_ns, None)
+
+
+def bump_version(user_id):
+    try:
+        cache.incr(version_key(user_id))
+    except ValueError:
+        cache.set(version_key(user_id), time.time_ns(), None)
+
+
+def invalidate_memberships(user_id):
+    """Сбрасывает закешированные множества после коммита транзакции.
+
+    Иначе параллельный запрос успел бы закешировать старое состояние под
+    новой версией.
+    """
+    transaction.on_commit(lambda: bump_version(user_id))
+
+
+class Memberships:
+    """Избранное, список покупок и подписки пользователя.
+
+    Каждое множество id загружается одним запросом при первом обращении
+    и живёт до конца запроса. При MEMBERSHIP_CACHE_TTL > 0 множества
+    также хранятся в общем кеше под ключом с версией пользователя,
+    которая увеличивается при каждом изменении.
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.sets = {}
+        self.version = None
+
+    def get_set(self, name):
+        if name not in self.sets:
+            self.sets[name] = self.load(name)
+        return self.sets[name]
+
+    def load(self, name):
+        ttl = settings.MEMBERSHIP_CACHE_TTL
+        if ttl:
+            if self.version is None:
+                self.version = get_version(self.user_id)
+            key = f'memberships:{self.user_id}:{name}:{self.version}'
+            ids = cache.get(key)
+            if ids is not None:
+                return ids
+        model, user_field, value_field = SETS[name]
+        ids = frozenset(model.objects.filter(
+            **{user_field: self.user_id}
+        ).values_list(value_field, flat=True))
+        if ttl:
+            cache.set(key, ids, ttl)
+        return ids
+
+    def is_favorited(self, recipe_id):
+        return recipe_id in self.get_set('favorites')
+
+    def is_in_shopping_cart(self, recipe_id):
+        return recipe_id in self.get_set('shopping_cart')
+
+    def is_subscribed(self, author_id):
+        return author_id in self.get_set('subscriptions')
+
+
+def get_memberships(request):
+    """Возвращает Memberships текущего пользователя или None для анонима."""
+    if request is None or request.user.is_anonymous:
+        return None
+    memberships = getattr(request, 'memberships', None)
+    if memberships is None or memberships.user_id != request.user.id:
+        memberships = Memberships(request.user.id)
+        request.memberships = memberships
+    return memberships
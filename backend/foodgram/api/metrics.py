@@ -0,0 +1,266 @@
+"""Метрики производительности запросов в формате Prometheus.
+
+PerformanceMiddleware для каждого маршрута считает время ответа,
+число и время запросов к БД, время сериализации и размер ответа,
+отмечает повторяющиеся запросы (N+1) и пишет медленные запросы в лог.
+Метрики хранятся в памяти процесса и отдаются представлением metrics.
+"""
+import hmac
+import logging
+import re
+import threading
+import time
+import traceback
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+
+from .middleware import HybridMiddleware
+
+logger = logging.getLogger('foodgram.performance')
+
+current_stats = ContextVar('current_stats', default=None)
+
+DURATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+NUMBERS = re.compile(r'\b\d+\b')
+
+
+class RequestStats:
+    """Данные об одном HTTP-запросе."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.statements = Counter()
+        self.stacks = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            if sql.lstrip()[:6].upper() == 'SELECT':
+                self.count_statement(NUMBERS.sub('?', sql))
+
+    def count_statement(self, statement):
+        self.statements[statement] += 1
+        if self.statements[statement] == settings.PERF_N_PLUS_ONE_THRESHOLD:
+            self.stacks[statement] = stack_sample()
+
+    def repeated(self):
+        return {
+            statement: count
+            for statement, count in self.statements.items()
+            if count >= settings.PERF_N_PLUS_ONE_THRESHOLD
+        }
+
+
+def stack_sample():
+    """Кадры стека из кода проекта, без стандартной библиотеки и пакетов."""
+    frames = [
+        frame for frame in traceback.extract_stack()[:-3]
+        if str(settings.BASE_DIR) in frame.filename
+        and 'site-packages' not in frame.filename
+        and frame.filename != __file__
+    ]
+    return ''.join(traceback.format_list(frames[-8:]))
+
+
+class Registry:
+    """Счётчики и гистограммы в памяти процесса."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+
+    def inc(self, name, labels, value=1):
+        with self.lock:
+            self.counters[name, labels] += value
+
+    def observe(self, name, labels, value):
+        with self.lock:
+            self.counters[name + '_sum', labels] += value
+            self.counters[name + '_count', labels] += 1
+            buckets = self.buckets[name, labels]
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    buckets[index] += 1
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(f'{name}{format_labels(labels)} {value:g}')
+            for (name, labels), buckets in sorted(self.buckets.items()):
+                for bound, value in zip(DURATION_BUCKETS, buckets):
+                    bucket = labels + (('le', f'{bound:g}'),)
+                    lines.append(
+                        f'{name}_bucket{format_labels(bucket)} {value}'
+                    )
+                count = self.counters[name + '_count', labels]
+                bucket = labels + (('le', '+Inf'),)
+                lines.append(
+                    f'{name}_bucket{format_labels(bucket)} {count:g}'
+                )
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    values = ','.join(
+        '{}="{}"'.format(
+            key, str(value).replace('\\', '\\\\').replace('"', '\\"')
+        )
+        for key, value in labels
+    )
+    return '{' + values + '}'
+
+
+registry = Registry()
+
+
+def get_route(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route
+
+
+def count_query(execute, sql, params, many, context):
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def add_query_counter(sender, connection, **kwargs):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+def instrument_connections():
+    """Считает запросы к БД в статистику текущего HTTP-запроса.
+
+    Обёртка ставится на каждое новое соединение, поэтому запросы
+    учитываются в любом потоке, куда скопирован контекст запроса: в ASGI
+    представления работают не в том потоке, что middleware.
+    """
+    connection_created.connect(add_query_counter)
+
+
+def timed(serializer):
+    """Добавляет время serializer.data в статистику текущего запроса.
+
+    Обёртка ставится на to_representation этого экземпляра, вложенные
+    сериализаторы не замеряются отдельно.
+    """
+    stats = current_stats.get()
+    if stats is None:
+        return serializer
+    to_representation = serializer.to_representation
+
+    def timed_representation(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return to_representation(*args, **kwargs)
+        finally:
+            stats.serializer_time += time.perf_counter() - start
+
+    serializer.to_representation = timed_representation
+    return serializer
+
+
+class SerializerTimingMixin:
+    """Замеряет время сериализаторов из get_serializer()."""
+
+    def get_serializer(self, *args, **kwargs):
+        return timed(super().get_serializer(*args, **kwargs))
+
+
+class PerformanceMiddleware(HybridMiddleware):
+
+    def handle(self, request):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        self.record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def ahandle(self, request):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        self.record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, stats, duration):
+        route = get_route(request)
+        labels = (('route', route),)
+        registry.inc('foodgram_requests_total', labels + (
+            ('method', request.method),
+            ('status', response.status_code),
+        ))
+        registry.observe(
+            'foodgram_request_duration_seconds', labels, duration
+        )
+        registry.inc('foodgram_db_queries_total', labels, stats.queries)
+        registry.inc('foodgram_db_duration_seconds_total', labels,
+                     stats.db_time)
+        registry.inc('foodgram_serializer_duration_seconds_total', labels,
+                     stats.serializer_time)
+        size = 0 if response.streaming else len(response.content)
+        registry.inc('foodgram_response_bytes_total', labels, size)
+        repeated = stats.repeated()
+        if repeated:
+            registry.inc('foodgram_n_plus_one_total', labels)
+            for statement, count in repeated.items():
+                logger.warning(
+                    'Повторяющийся запрос (%s раз) в %s %s: %s\n%s',
+                    count, request.method, route, statement,
+                    stats.stacks.get(statement, ''),
+                )
+        if (
+            duration * 1000 >= settings.PERF_SLOW_REQUEST_MS
+            or stats.queries >= settings.PERF_SLOW_REQUEST_QUERIES
+        ):
+            logger.warning(
+                'Медленный запрос %s %s (%s): %.1f мс, запросов к БД %s '
+                '(%.1f мс), сериализация %.1f мс, ответ %s байт',
+                request.method, request.get_full_path(), route,
+                duration * 1000, stats.queries, stats.db_time * 1000,
+                stats.serializer_time * 1000, size,
+            )
+
+
+def metrics(request):
+    """Метрики в текстовом формате Prometheus."""
+    token = settings.PERF_METRICS_TOKEN
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if not (
+        (token and hmac.compare_digest(
+            authorization.encode(), f'Bearer {token}'.encode()
+        ))
+        or request.user.is_staff
+    ):
+        raise Http404
+    return HttpResponse(
+        registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
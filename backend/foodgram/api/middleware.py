@@ -0,0 +1,34 @@
+"""Основа middleware, которые работают и в WSGI, и в ASGI.
+
+Если в цепочке есть middleware только для синхронного режима, Django в
+ASGI выполняет его и всё, что под ним, в одном общем потоке, и запросы
+процесса ждут друг друга.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+
+class HybridMiddleware:
+    """Вызывает handle() в WSGI и ahandle() в ASGI.
+
+    По умолчанию оба метода только передают запрос дальше по цепочке.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.ahandle(request)
+        return self.handle(request)
+
+    def handle(self, request):
+        return self.get_response(request)
+
+    async def ahandle(self, request):
+        return await self.get_response(request)
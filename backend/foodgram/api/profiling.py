@@ -0,0 +1,137 @@
+"""Профилирование отдельных запросов в продакшене.
+
+Запрос профилируется, если в заголовке X-Profile передана подпись из
+команды profiling_token или если он попал в случайную выборку
+PROFILING_SAMPLE_RATE. Результат cProfile сохраняется в PROFILING_DIR
+в формате pstats (открывается snakeviz, speedscope и pstats), старые
+файлы удаляются при превышении PROFILING_MAX_FILES/PROFILING_MAX_BYTES.
+В режиме ASGI запросы не профилируются: cProfile видит только свой
+поток, а представления работают в других.
+"""
+import cProfile
+import os
+import random
+import re
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core import signing
+from django.http import FileResponse, Http404
+from django.shortcuts import render
+
+from .metrics import get_route
+from .middleware import HybridMiddleware
+
+HEADER = 'HTTP_X_PROFILE'
+SALT = 'foodgram.profiling'
+EXTENSION = '.prof'
+
+UNSAFE_CHARS = re.compile(r'[^\w.-]+')
+
+
+def make_token():
+    return signing.TimestampSigner(salt=SALT).sign('profile')
+
+
+def is_signed(value):
+    try:
+        signing.TimestampSigner(salt=SALT).unsign(
+            value, max_age=settings.PROFILING_TOKEN_MAX_AGE
+        )
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def should_profile(request):
+    value = request.META.get(HEADER)
+    if value:
+        return is_signed(value)
+    rate = settings.PROFILING_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+def get_captures():
+    """Сохранённые профили, от новых к старым."""
+    directory = settings.PROFILING_DIR
+    if not os.path.isdir(directory):
+        return []
+    captures = []
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.name.endswith(EXTENSION):
+            stat = entry.stat()
+            captures.append({
+                'name': entry.name,
+                'path': entry.path,
+                'size': stat.st_size,
+                'created': datetime.fromtimestamp(stat.st_mtime),
+            })
+    return sorted(captures, key=lambda item: item['created'], reverse=True)
+
+
+def prune_captures():
+    """Удаляет старые профили сверх лимитов на число файлов и объём."""
+    total = 0
+    for index, capture in enumerate(get_captures()):
+        total += capture['size']
+        if (
+            index >= settings.PROFILING_MAX_FILES
+            or total > settings.PROFILING_MAX_BYTES
+        ):
+            try:
+                os.remove(capture['path'])
+            except FileNotFoundError:
+                pass
+
+
+def save_capture(profiler, request, route, duration):
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    name = '{}-{}-{}-{}ms{}'.format(
+        datetime.now().strftime('%Y%m%d-%H%M%S-%f'),
+        request.method,
+        UNSAFE_CHARS.sub('_', route),
+        int(duration * 1000),
+        EXTENSION,
+    )
+    profiler.dump_stats(os.path.join(settings.PROFILING_DIR, name))
+    prune_captures()
+
+
+class ProfilingMiddleware(HybridMiddleware):
+
+    def handle(self, request):
+        if not should_profile(request):
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        save_capture(
+            profiler, request, get_route(request),
+            time.perf_counter() - start,
+        )
+        return response
+
+    async def ahandle(self, request):
+        return await self.get_response(request)
+
+
+def capture_list(request):
+    """Страница админки со списком последних профилей."""
+    return render(request, 'admin/profiles.html', {
+        'title': 'Профили запросов',
+        'captures': get_captures(),
+    })
+
+
+def capture_download(request, name):
+    if name != os.path.basename(name) or not name.endswith(EXTENSION):
+        raise Http404
+    path = os.path.join(settings.PROFILING_DIR, name)
+    if not os.path.isfile(path):
+        raise Http404
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=name)
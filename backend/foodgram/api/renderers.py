@@ -0,0 +1,40 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson с тем же выводом, что и у стандартного.
+
+    Даты и время orjson передаёт кодировщику DRF: сам он пишет смещение
+    +00:00 вместо Z. Без orjson, при запросе отступов и для
+    неподдерживаемых orjson значений используется обычный JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or not self.compact
+            or self.ensure_ascii
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=(
+                    orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+                )
+            )
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace(
+            '\u2028'.encode(), b'\\u2028'
+        ).replace(
+            '\u2029'.encode(), b'\\u2029'
+        )
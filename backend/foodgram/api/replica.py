@@ -0,0 +1,107 @@
+"""Чтение с реплики БД для безопасных запросов к API.
+
+Если в DATABASES есть алиас replica, запросы GET/HEAD/OPTIONS
+к представлениям с ReplicaReadMixin читают с реплики. После успешного
+изменяющего запроса пользователь на REPLICA_PIN_SECONDS читает только
+с основной БД, чтобы сразу видеть свои изменения. Отметка об этом
+передаётся в подписанной cookie, а с общим кешем (SHARED_CACHE) ещё и
+хранится в нём для клиентов без cookie: в LocMemCache её видел бы
+только процесс, обработавший изменение. Внутри транзакции
+на основной БД чтение тоже идёт в неё: иначе транзакция не увидела бы
+своих же изменений.
+"""
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.deprecation import MiddlewareMixin
+from rest_framework.permissions import SAFE_METHODS
+
+REPLICA = 'replica'
+
+use_replica = ContextVar('use_replica', default=False)
+
+
+PIN_COOKIE = 'replica_pin'
+PIN_SALT = 'api.replica'
+
+
+def pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+
+def is_pinned(request):
+    if request.user.is_anonymous:
+        return False
+    pinned = request.get_signed_cookie(
+        PIN_COOKIE, None, salt=PIN_SALT,
+        max_age=settings.REPLICA_PIN_SECONDS
+    )
+    if pinned == str(request.user.id):
+        return True
+    return settings.SHARED_CACHE and bool(cache.get(pin_key(request.user.id)))
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if (
+            use_replica.get()
+            and REPLICA in settings.DATABASES
+            and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
+
+
+class ReplicaReadMixin:
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (
+            request.method in SAFE_METHODS
+            and REPLICA in settings.DATABASES
+            and not is_pinned(request)
+        ):
+            self.replica_token = use_replica.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, 'replica_token', None)
+        if token is not None:
+            use_replica.reset(token)
+            self.replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ReplicaPinMiddleware(MiddlewareMixin):
+    """Закрепляет чтение за основной БД после изменений пользователя."""
+
+    def process_response(self, request, response):
+        user = getattr(request, 'user', None)
+        if (
+            request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and user is not None
+            and user.is_authenticated
+            and REPLICA in settings.DATABASES
+        ):
+            response.set_signed_cookie(
+                PIN_COOKIE, user.id, salt=PIN_SALT,
+                max_age=settings.REPLICA_PIN_SECONDS, httponly=True,
+                samesite='Lax'
+            )
+            if settings.SHARED_CACHE:
+                cache.set(
+                    pin_key(user.id), 1, settings.REPLICA_PIN_SECONDS
+                )
+        return response
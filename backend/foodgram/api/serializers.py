@@ -1,16 +1,24 @@
 import base64
+from collections import OrderedDict
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.files.base import ContentFile
-from django.db.models import F
+from django.db.models import F, Manager, Prefetch, prefetch_related_objects
 from django.shortcuts import get_object_or_404
 from djoser.serializers import (SetPasswordSerializer, UserCreateSerializer,
                                 UserSerializer)
 from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
                             ShoppingCart, Tag)
+from recipes.nutrition import TOTAL_FIELDS, update_recipe_totals
 from rest_framework import serializers
 from users.models import Subscription
 
+from .cache import invalidate_recipes
+from .fast import recipe_fragments, recipe_show_rows
+from .membership import get_memberships
+
 User = get_user_model()
 
 
@@ -39,10 +47,8 @@ class CustomUserSerializer(UserSerializer):
                   'last_name', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
-        current_user = self.context.get('request').user
-        if current_user.is_anonymous:
-            return False
-        return current_user.subscriber.filter(author=obj).exists()
+        memberships = get_memberships(self.context.get('request'))
+        return memberships is not None and memberships.is_subscribed(obj.id)
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -98,13 +104,137 @@ class AuthorShowSerializer(serializers.ModelSerializer):
                             'first_name', 'last_name')
 
     def get_is_subscribed(self, obj):
-        current_user = self.context.get('request').user
-        if current_user.is_anonymous:
-            return False
-        return current_user.subscriber.filter(author=obj).exists()
+        memberships = get_memberships(self.context.get('request'))
+        return memberships is not None and memberships.is_subscribed(obj.id)
+
+
+def requested_fields(request, param='fields'):
+    """Имена из ?fields=a,b (или ?expand=), None — параметра нет."""
+    value = request.query_params.get(param) if request is not None else None
+    if value is None:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class SparseFieldsMixin:
+    """Набор полей по ?fields=, вложенные объекты по ?expand=.
+
+    Без fields отдаются все поля. С fields остаются только перечисленные,
+    а связи из compact_fields отдаются в виде id, если их нет в expand.
+    Действует только на сериализатор верхнего уровня и элементы
+    списка верхнего уровня.
+    """
+
+    compact_fields = {}
+
+    @property
+    def sparse_fields(self):
+        if self.field_name:
+            return None
+        return requested_fields(self.context.get('request'))
+
+    @property
+    def expanded_fields(self):
+        return requested_fields(self.context.get('request'), 'expand') or set()
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested = self.sparse_fields
+        if requested is None:
+            return fields
+        expand = self.expanded_fields
+        for name in list(fields):
+            if name not in requested:
+                del fields[name]
+            elif name in self.compact_fields and name not in expand:
+                fields[name] = self.compact_fields[name]()
+        return fields
+
+
+def prefetch_recipes(recipes, fields=None, expand=()):
+    """Загружает авторов, теги и ингредиенты рецептов тремя запросами.
+
+    fields и expand — как в SparseFieldsMixin: связи, которые не
+    запрошены, не загружаются, а для свёрнутых до id не нужны JOIN.
+    """
+    def wanted(name):
+        return fields is None or name in fields
+
+    def expanded(name):
+        return fields is None or name in expand
+
+    lookups = []
+    if wanted('author') and expanded('author'):
+        lookups.append('author')
+    if wanted('tags'):
+        lookups.append('tags')
+    if wanted('ingredients'):
+        queryset = IngredientRecipe.objects.order_by('id')
+        if expanded('ingredients'):
+            queryset = queryset.select_related('ingredient')
+        lookups.append(Prefetch('ingredientrecipes', queryset))
+    prefetch_related_objects(recipes, *lookups)
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Список рецептов из закешированных фрагментов.
+
+    Не зависящая от пользователя часть каждого рецепта хранится в кеше
+    под ключом id + updated_at + хост (ссылка на картинку абсолютная)
+    и читается одним get_many на страницу,
+    флаги текущего пользователя добавляются при каждом запросе.
+    """
+
+    def to_representation(self, data):
+        ttl = settings.RECIPE_FRAGMENT_CACHE_TTL
+        recipes = list(data.all() if isinstance(data, Manager) else data)
+        fields = self.child.sparse_fields
+        if fields is not None:
+            prefetch_recipes(recipes, fields, self.child.expanded_fields)
+            return super().to_representation(recipes)
+        if not ttl and not settings.FAST_SERIALIZERS:
+            prefetch_recipes(recipes)
+            return super().to_representation(recipes)
+        request = self.context.get('request')
+        origin = (
+            f'{request.scheme}://{request.get_host()}' if request else ''
+        )
+        keys = {
+            recipe.id: 'recipe-fragment:{}:{}:{}'.format(
+                recipe.id, recipe.updated_at.timestamp(), origin
+            )
+            for recipe in recipes
+        }
+        fragments = cache.get_many(list(keys.values())) if ttl else {}
+        missing = [
+            recipe for recipe in recipes if keys[recipe.id] not in fragments
+        ]
+        if missing:
+            rendered = {
+                keys[recipe_id]: fragment
+                for recipe_id, fragment in self.render_fragments(
+                    missing
+                ).items()
+            }
+            fragments.update(rendered)
+            if ttl:
+                cache.set_many(rendered, ttl)
+        return [
+            self.child.add_flags(fragments[keys[recipe.id]], recipe)
+            for recipe in recipes
+        ]
+
+    def render_fragments(self, recipes):
+        if settings.FAST_SERIALIZERS:
+            return recipe_fragments(recipes, self.context.get('request'))
+        prefetch_recipes(recipes)
+        return {
+            recipe.id: self.child.get_fragment(recipe) for recipe in recipes
+        }
 
 
-class RecipeListRetrieveSerializer(serializers.ModelSerializer):
+class RecipeListRetrieveSerializer(SparseFieldsMixin,
+                                   serializers.ModelSerializer):
     image = Base64ImageField(required=True, allow_null=False)
     tags = TagSerializer(many=True, read_only=True)
     author = AuthorShowSerializer(read_only=True)
@@ -116,30 +246,88 @@ class RecipeListRetrieveSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time')
-        read_only_fields = ('name', 'image', 'text', 'cooking_time')
+                  'name', 'image', 'text', 'cooking_time',
+                  'calories', 'proteins', 'fats', 'carbohydrates', 'cost')
+        read_only_fields = ('name', 'image', 'text', 'cooking_time',
+                            'calories', 'proteins', 'fats',
+                            'carbohydrates', 'cost')
+        list_serializer_class = RecipeListSerializer
+
+    compact_fields = {
+        'author': lambda: serializers.PrimaryKeyRelatedField(read_only=True),
+        'tags': lambda: serializers.PrimaryKeyRelatedField(
+            many=True, read_only=True
+        ),
+        'ingredients': lambda: serializers.SerializerMethodField(
+            'get_ingredient_amounts'
+        ),
+    }
+
+    def get_fragment(self, instance):
+        data = self.to_representation(instance)
+        data.pop('is_favorited')
+        data.pop('is_in_shopping_cart')
+        data['author'].pop('is_subscribed')
+        return data
+
+    def add_flags(self, fragment, instance):
+        memberships = get_memberships(self.context.get('request'))
+        flags = {
+            'is_favorited': (
+                memberships is not None
+                and memberships.is_favorited(instance.id)
+            ),
+            'is_in_shopping_cart': (
+                memberships is not None
+                and memberships.is_in_shopping_cart(instance.id)
+            ),
+        }
+        data = OrderedDict(
+            (field, flags[field] if field in flags else fragment[field])
+            for field in self.Meta.fields
+        )
+        data['author'] = OrderedDict(fragment['author'])
+        data['author']['is_subscribed'] = (
+            memberships is not None
+            and memberships.is_subscribed(instance.author_id)
+        )
+        return data
 
     def get_ingredients(self, obj):
-        return (
+        prefetched = getattr(obj, '_prefetched_objects_cache', {})
+        if 'ingredientrecipes' in prefetched:
+            return [
+                {
+                    'id': item.ingredient.id,
+                    'name': item.ingredient.name,
+                    'measurement_unit': item.ingredient.measurement_unit,
+                    'amount': item.amount,
+                }
+                for item in obj.ingredientrecipes.all()
+            ]
+        return list(
             obj.ingredients.values(
                 'id', 'name', 'measurement_unit',
                 amount=F('ingredientrecipes__amount')
-            )
+            ).order_by('ingredientrecipes__id')
         )
 
+    def get_ingredient_amounts(self, obj):
+        return [
+            {'id': item.ingredient_id, 'amount': item.amount}
+            for item in obj.ingredientrecipes.all()
+        ]
+
     def get_is_favorited(self, obj):
-        current_user = self.context.get('request').user
-        if current_user.is_anonymous:
-            return False
-        return Favorite.objects.filter(user=current_user, recipe=obj).exists()
+        memberships = get_memberships(self.context.get('request'))
+        return memberships is not None and memberships.is_favorited(obj.id)
 
     def get_is_in_shopping_cart(self, obj):
-        current_user = self.context.get('request').user
-        if current_user.is_anonymous:
-            return False
-        return ShoppingCart.objects.filter(
-            user=current_user, recipe=obj
-        ).exists()
+        memberships = get_memberships(self.context.get('request'))
+        return (
+            memberships is not None
+            and memberships.is_in_shopping_cart(obj.id)
+        )
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
@@ -182,6 +370,9 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                 amount=ingredient['amount']
             ) for ingredient in ingredients_data]
         )
+        update_recipe_totals([recipe.id])
+        recipe.refresh_from_db(fields=TOTAL_FIELDS)
+        invalidate_recipes([recipe.id])
 
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredientrecipes')
@@ -189,6 +380,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(**validated_data)
         self.set_ingredients(ingredients_data, recipe)
         recipe.tags.set(tags)
+        recipe.save(update_fields=['updated_at'])
         return recipe
 
     def update(self, instance, validated_data):
@@ -211,12 +403,40 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         ).data
 
 
+class RecipeShowListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        if not settings.FAST_SERIALIZERS:
+            return super().to_representation(data)
+        if isinstance(data, Manager):
+            data = data.all()
+        return recipe_show_rows(data, self.context.get('request'))
+
+
 class RecipeShowSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time')
+        list_serializer_class = RecipeShowListSerializer
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=settings.BULK_RECIPES_LIMIT
+    )
+
+    def validate_recipes(self, value):
+        recipes = Recipe.objects.in_bulk(set(value))
+        missing = set(value) - set(recipes)
+        if missing:
+            raise serializers.ValidationError(
+                'Рецепты не найдены: '
+                + ', '.join(str(pk) for pk in sorted(missing))
+            )
+        return list(recipes)
 
 
 class ShoppingCartSerializer(serializers.ModelSerializer):
@@ -241,7 +461,8 @@ class FavoriteSerializer(serializers.ModelSerializer):
         return RecipeShowSerializer(instance.recipe).data
 
 
-class ShowSubscriptionsSerializer(serializers.ModelSerializer):
+class ShowSubscriptionsSerializer(SparseFieldsMixin,
+                                  serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
     recipes_count = serializers.SerializerMethodField()
@@ -253,24 +474,38 @@ class ShowSubscriptionsSerializer(serializers.ModelSerializer):
         read_only_fields = ('email', 'id', 'username',
                             'first_name', 'last_name')
 
+    compact_fields = {
+        'recipes': lambda: serializers.SerializerMethodField(
+            'get_recipe_ids'
+        ),
+    }
+
     def get_is_subscribed(self, obj):
-        current_user = self.context.get('request').user
-        if current_user.is_anonymous:
-            return False
-        return current_user.subscriber.filter(author=obj).exists()
+        memberships = get_memberships(self.context.get('request'))
+        return memberships is not None and memberships.is_subscribed(obj.id)
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
-    def get_recipes(self, obj):
+    def get_author_recipes(self, obj):
+        """Рецепты автора, из prefetch_related, если он был."""
         request = self.context.get('request')
         recipes_limit = request.GET.get('recipes_limit')
         recipes = obj.recipes.all()
         if recipes_limit:
             recipes = recipes[:int(recipes_limit)]
+        return list(recipes)
+
+    def get_recipes(self, obj):
+        recipes = self.get_author_recipes(obj)
         serializer = RecipeShowSerializer(recipes, many=True, read_only=True)
         return serializer.data
 
+    def get_recipe_ids(self, obj):
+        return [recipe.id for recipe in self.get_author_recipes(obj)]
+
 
 class SubscribeSerializer(serializers.ModelSerializer):
     author = ShowSubscriptionsSerializer(read_only=True)
@@ -0,0 +1,174 @@
+"""Сброс нагрузки на дорогих маршрутах при перегрузке процесса.
+
+LoadSheddingMiddleware следит за тремя сигналами: сколько запросов
+процесс обрабатывает одновременно, среднее ожидание соединения из пула
+БД и среднее время в очереди перед воркером (по заголовку
+X-Request-Start от nginx) за последние SHED_WINDOW секунд. Если одно из
+значений выше порога, запросы к маршрутам из SHED_ROUTES и анонимные
+запросы глубоких страниц списка рецептов получают 503 с Retry-After,
+остальные обслуживаются как обычно.
+
+Первые два сигнала работают не везде: синхронный воркер gunicorn
+обрабатывает один запрос за раз, а статистика пула есть только с
+DB_ENGINE=foodgram.db. Время в очереди от этого не зависит.
+"""
+import logging
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.http import JsonResponse
+from foodgram.db.base import get_pool_stats
+
+from .metrics import get_route, registry
+from .middleware import HybridMiddleware
+from .throttling import is_deep_page
+
+logger = logging.getLogger(__name__)
+
+
+class PoolWaitMonitor:
+    """Среднее ожидание соединения из пулов за последнее окно."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.snapshot = (time.monotonic(), 0.0, 0)
+        self.wait = 0.0
+
+    def current(self):
+        now = time.monotonic()
+        with self.lock:
+            started, wait_total, acquired = self.snapshot
+            if now - started < settings.SHED_WINDOW:
+                return self.wait
+            pools = get_pool_stats().values()
+            new_wait = sum(pool['wait_total'] for pool in pools)
+            new_acquired = sum(pool['acquired'] for pool in pools)
+            if new_acquired > acquired:
+                self.wait = (
+                    (new_wait - wait_total) / (new_acquired - acquired)
+                )
+            else:
+                self.wait = 0.0
+            self.snapshot = (now, new_wait, new_acquired)
+            return self.wait
+
+
+class QueueTimeMonitor:
+    """Среднее время запросов в очереди перед воркером за последнее окно."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.total = 0.0
+        self.count = 0
+        self.wait = 0.0
+
+    def roll(self):
+        now = time.monotonic()
+        if now - self.started < settings.SHED_WINDOW:
+            return
+        self.wait = self.total / self.count if self.count else 0.0
+        self.started, self.total, self.count = now, 0.0, 0
+
+    def add(self, request):
+        """Учитывает X-Request-Start: t=<секунды> (nginx $msec)."""
+        header = request.META.get('HTTP_X_REQUEST_START', '')
+        try:
+            started = float(header.replace('t=', '', 1))
+        except ValueError:
+            return
+        with self.lock:
+            self.roll()
+            self.total += max(time.time() - started, 0.0)
+            self.count += 1
+
+    def current(self):
+        with self.lock:
+            self.roll()
+            return self.wait
+
+
+@lru_cache(maxsize=None)
+def warn_unavailable_signals(is_async):
+    """Один раз на процесс сообщает, какие сигналы перегрузки не работают."""
+    database = settings.DATABASES['default']
+    if database['ENGINE'] != 'foodgram.db' or not database.get('POOL_SIZE'):
+        logger.warning(
+            'Load shedding by pool wait is off: it needs '
+            'DB_ENGINE=foodgram.db and DB_POOL_SIZE > 0'
+        )
+    if not is_async:
+        logger.warning(
+            'Load shedding by in-flight requests sees one request at a '
+            'time under sync gunicorn workers; nginx must send '
+            'X-Request-Start for shedding by queue time'
+        )
+
+
+class LoadSheddingMiddleware(HybridMiddleware):
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.pool_wait = PoolWaitMonitor()
+        self.queue_time = QueueTimeMonitor()
+        warn_unavailable_signals(self.is_async)
+
+    def change_in_flight(self, delta):
+        with self.lock:
+            self.in_flight += delta
+
+    def handle(self, request):
+        self.queue_time.add(request)
+        self.change_in_flight(1)
+        try:
+            return self.get_response(request)
+        finally:
+            self.change_in_flight(-1)
+
+    async def ahandle(self, request):
+        self.queue_time.add(request)
+        self.change_in_flight(1)
+        try:
+            return await self.get_response(request)
+        finally:
+            self.change_in_flight(-1)
+
+    def is_expensive(self, request, route):
+        if route in settings.SHED_ROUTES:
+            return True
+        return (
+            route == 'api:recipes-list'
+            and 'HTTP_AUTHORIZATION' not in request.META
+            and is_deep_page(request)
+        )
+
+    def overload_reason(self):
+        if self.in_flight > settings.SHED_MAX_IN_FLIGHT:
+            return 'in_flight'
+        if self.pool_wait.current() * 1000 > settings.SHED_MAX_POOL_WAIT_MS:
+            return 'pool_wait'
+        if self.queue_time.current() * 1000 > settings.SHED_MAX_QUEUE_MS:
+            return 'queue_time'
+        return None
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        route = get_route(request)
+        if not self.is_expensive(request, route):
+            return None
+        reason = self.overload_reason()
+        if reason is None:
+            return None
+        registry.inc('foodgram_shed_total', (
+            ('route', route),
+            ('reason', reason),
+        ))
+        response = JsonResponse(
+            {'detail': 'Сервер перегружен, повторите запрос позже.'},
+            status=503,
+        )
+        response['Retry-After'] = str(settings.SHED_RETRY_AFTER)
+        return response
@@ -0,0 +1,132 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+from recipes.deletion import pre_bulk_delete
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, Tag)
+from recipes.nutrition import totals_updated
+from rest_framework.authtoken.models import Token
+from users.models import Subscription
+
+from .authentication import invalidate_tokens
+from .cache import (INGREDIENTS_VERSION, TAGS_VERSION, bump_version,
+                    invalidate_recipes, touch_recipes)
+from .membership import invalidate_memberships
+
+User = get_user_model()
+
+AUTHOR_FIELDS = ('username', 'first_name', 'last_name', 'email')
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, update_fields, **kwargs):
+    """Отмечает, изменились ли поля автора, которые есть в рецептах."""
+    if instance._state.adding:
+        return
+    fields = [
+        field for field in AUTHOR_FIELDS
+        if update_fields is None or field in update_fields
+    ]
+    instance._author_changed = bool(fields) and User.objects.filter(
+        pk=instance.pk
+    ).values_list(*fields).first() != tuple(
+        getattr(instance, field) for field in fields
+    )
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    if created:
+        return
+    invalidate_tokens(
+        Token.objects.filter(user=instance).values_list('key', flat=True)
+    )
+    if not getattr(instance, '_author_changed', True):
+        return
+    recipe_ids = list(instance.recipes.values_list('id', flat=True))
+    if recipe_ids:
+        touch_recipes(recipe_ids)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Subscription)
+def membership_changed(sender, instance, **kwargs):
+    invalidate_memberships(instance.user_id)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    recipe_ids = [instance.id]
+    transaction.on_commit(lambda: invalidate_recipes(recipe_ids))
+
+
+@receiver(post_save, sender=IngredientRecipe)
+def ingredientrecipe_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_recipes([instance.recipe_id]))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_relations_changed(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        recipe_ids = [instance.id]
+        transaction.on_commit(lambda: invalidate_recipes(recipe_ids))
+    elif pk_set:
+        touch_recipes(pk_set)
+    else:
+        touch_recipes(instance.recipes.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def recipe_part_changed(sender, instance, **kwargs):
+    touch_recipes(instance.recipes.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def catalog_changed(sender, **kwargs):
+    name = TAGS_VERSION if sender is Tag else INGREDIENTS_VERSION
+    transaction.on_commit(lambda: bump_version(name))
+
+
+@receiver(pre_bulk_delete, sender=Recipe)
+@receiver(totals_updated, sender=Recipe)
+def recipes_bulk_changed(sender, pks, **kwargs):
+    transaction.on_commit(lambda: invalidate_recipes(pks))
+
+
+@receiver(pre_bulk_delete, sender=Favorite)
+@receiver(pre_bulk_delete, sender=ShoppingCart)
+@receiver(pre_bulk_delete, sender=Subscription)
+def memberships_bulk_deleted(sender, pks, **kwargs):
+    for user_id in set(sender.objects.filter(pk__in=pks).values_list(
+            'user_id', flat=True)):
+        invalidate_memberships(user_id)
+
+
+@receiver(pre_bulk_delete, sender=User)
+def users_bulk_deleted(sender, pks, **kwargs):
+    keys = list(
+        Token.objects.filter(user_id__in=pks).values_list('key', flat=True)
+    )
+    transaction.on_commit(lambda: invalidate_tokens(keys))
@@ -0,0 +1,1419 @@
+import asyncio
+import io
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.backends.postgresql import base as postgresql
+from django.test import (AsyncClient, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from foodgram.db.base import DatabaseWrapper as PooledDatabaseWrapper
+from foodgram.db.base import pools
+from psycopg2 import extensions
+from recipes import index
+from recipes.deletion import bulk_delete
+from recipes.exchange import RecipeImporter
+from recipes.models import (Favorite, FeedItem, Ingredient, IngredientRecipe,
+                            PopularAuthor, Recipe, ShoppingCart, SimilarRecipe,
+                            StaleRecipe, Tag)
+from recipes.nutrition import update_ingredient_recipes, update_recipe_totals
+from recipes.similarity import compute_similar, mark_stale, refresh_similar
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+from users.models import Subscription, User
+
+from .authentication import CACHE_PREFIX, local_cache
+from .cache import detail_key, get_version
+from .membership import version_key
+from .metrics import registry, timed
+from .renderers import FastJSONRenderer
+from .replica import REPLICA, use_replica
+from .serializers import (RecipeListRetrieveSerializer, RecipeShowSerializer,
+                          TagSerializer)
+from .throttling import TokenBucketThrottle
+from .units import consolidate
+from .urls import async_urlpatterns
+from .views import IngredientViewSet, RecipeViewSet
+
+urlpatterns = [path('api/', include((async_urlpatterns, 'api')))]
+
+
+def make_user(name):
+    return User.objects.create_user(
+        email=f'{name}@example.com',
+        username=name,
+        first_name=name,
+        last_name=name,
+        password='Password-12345',
+    )
+
+
+def make_client(user=None):
+    client = APIClient()
+    if user is not None:
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
+
+
+def make_recipe(author, name='Рецепт', tags=(), ingredients=()):
+    recipe = Recipe.objects.create(
+        author=author, name=name, text='Текст', cooking_time=5,
+        image='recipes/test.png',
+    )
+    recipe.tags.set(tags)
+    for ingredient, amount in ingredients:
+        recipe.ingredientrecipes.create(ingredient=ingredient, amount=amount)
+    return recipe
+
+
+def run_concurrently(count, request):
+    """Выполняет request(index) в count потоках одновременно."""
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def run(index):
+        try:
+            barrier.wait()
+            results[index] = request(index)
+        finally:
+            connections.close_all()
+
+    threads = [
+        threading.Thread(target=run, args=(index,)) for index in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class SlowCache:
+    """Кеш с медленным чтением, чтобы параллельные запросы пересекались."""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def get(self, *args, **kwargs):
+        value = self.cache.get(*args, **kwargs)
+        time.sleep(0.01)
+        return value
+
+    def __getattr__(self, name):
+        return getattr(self.cache, name)
+
+
+class ConcurrentMembershipTests(TransactionTestCase):
+    """Повторные POST и DELETE в параллельных запросах."""
+
+    threads = 4
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Нужна файловая БД SQLite (DB_TEST_NAME).')
+        self.author = make_user('author')
+        self.user = make_user('reader')
+        self.recipe = make_recipe(self.author)
+        self.clients = [make_client(self.user) for _ in range(self.threads)]
+
+    def status_codes(self, method, url):
+        return sorted(
+            response.status_code for response in run_concurrently(
+                self.threads,
+                lambda index: getattr(self.clients[index], method)(url),
+            )
+        )
+
+    def check(self, url, model, **filters):
+        self.assertEqual(
+            self.status_codes('post', url),
+            [201] + [400] * (self.threads - 1),
+        )
+        self.assertEqual(model.objects.filter(**filters).count(), 1)
+        self.assertEqual(
+            self.status_codes('delete', url),
+            [204] + [404] * (self.threads - 1),
+        )
+        self.assertFalse(model.objects.filter(**filters).exists())
+
+    def test_favorite(self):
+        self.check(
+            f'/api/recipes/{self.recipe.id}/favorite/',
+            Favorite, user=self.user, recipe=self.recipe,
+        )
+
+    def test_shopping_cart(self):
+        self.check(
+            f'/api/recipes/{self.recipe.id}/shopping_cart/',
+            ShoppingCart, user=self.user, recipe=self.recipe,
+        )
+
+    def test_subscribe(self):
+        self.check(
+            f'/api/users/{self.author.id}/subscribe/',
+            Subscription, user=self.user, author=self.author,
+        )
+
+    def test_missing_target(self):
+        client = self.clients[0]
+        self.assertEqual(
+            client.post('/api/recipes/999999/favorite/').status_code, 404
+        )
+        self.assertEqual(
+            client.delete('/api/recipes/999999/favorite/').status_code, 404
+        )
+
+
+class TokenCacheTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user('reader')
+        self.client = make_client(self.user)
+        self.key = Token.objects.get(user=self.user).key
+        cache.clear()
+        local_cache.delete(self.key)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_process_cache_is_not_shared(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        self.assertIsNone(cache.get(CACHE_PREFIX + self.key))
+
+    @override_settings(SHARED_CACHE=True)
+    def test_shared_cache(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        self.assertIsNotNone(cache.get(CACHE_PREFIX + self.key))
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(cache.get(CACHE_PREFIX + self.key))
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+
+class TokenBucketTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    @mock.patch.object(TokenBucketThrottle, 'cache', SlowCache(cache))
+    @mock.patch.dict(TokenBucketThrottle.THROTTLE_RATES, {
+        'ingredients': '3/min'
+    })
+    def test_concurrent_requests(self):
+        view = IngredientViewSet()
+
+        def request(index):
+            return TokenBucketThrottle().allow_request(
+                Request(RequestFactory().get('/api/ingredients/')), view
+            )
+
+        self.assertEqual(run_concurrently(8, request).count(True), 3)
+
+
+class ConsolidateTests(SimpleTestCase):
+
+    def test_units(self):
+        self.assertEqual(consolidate([
+            ('Мука', 'г', 500),
+            ('Мука', 'кг', 1),
+            ('Молоко', 'ст. л.', 2),
+            ('Молоко', 'мл', 100),
+            ('Молоко', 'стакан', 1),
+            ('Соль', 'ч. л.', 1),
+            ('Соль', 'ч. л.', 2),
+            ('Сахар', 'г', 333),
+            ('Сахар', 'кг', 1),
+        ]), [
+            ('Молоко', '1.52', 'стакан'),
+            ('Мука', '1.5', 'кг'),
+            ('Сахар', '1333', 'г'),
+            ('Соль', '3', 'ч. л.'),
+        ])
+
+    def test_incompatible_units(self):
+        self.assertEqual(consolidate([
+            ('Яйцо', 'шт', 2),
+            ('Яйцо', 'г', 50),
+            ('Яйцо', 'шт', 1),
+        ]), [
+            ('Яйцо', '50', 'г'),
+            ('Яйцо', '3', 'шт'),
+        ])
+
+
+class FakeConnection:
+    closed = 0
+
+    def get_transaction_status(self):
+        return extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    alias = 'pool-test'
+
+    def tearDown(self):
+        pools.pop(self.alias, None)
+
+    @mock.patch.object(
+        postgresql.DatabaseWrapper, 'get_new_connection',
+        lambda self, conn_params: FakeConnection()
+    )
+    def test_pool_smaller_than_threads(self):
+        settings_dict = {
+            **connections['default'].settings_dict,
+            'CONN_MAX_AGE': 60,
+            'HEALTH_CHECKS': False,
+            'POOL_SIZE': 2,
+            'POOL_TIMEOUT': 0.5,
+        }
+
+        def request(index):
+            wrapper = PooledDatabaseWrapper(settings_dict, self.alias)
+            wrapper.connection = wrapper.get_new_connection({})
+            wrapper.autocommit = True
+            wrapper.close_at = time.monotonic() + 60
+            time.sleep(0.05)
+            wrapper.close_if_unusable_or_obsolete()
+            return wrapper.connection is None
+
+        self.assertEqual(run_concurrently(6, request), [True] * 6)
+        stats = pools[self.alias].stats()
+        self.assertEqual(stats['timeouts'], 0)
+        self.assertEqual(stats['in_use'], 0)
+        self.assertLessEqual(stats['idle'], 2)
+
+
+@override_settings(MEMBERSHIP_CACHE_TTL=60)
+class MembershipCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('reader')
+        self.client = make_client(self.user)
+        self.recipe = make_recipe(make_user('author'))
+        self.url = f'/api/recipes/{self.recipe.id}/'
+
+    def in_cart(self):
+        return self.client.get(self.url).json()['is_in_shopping_cart']
+
+    def change(self, method, url):
+        """Выполняет запрос и проверяет, что сброс ждёт коммита."""
+        version = cache.get(version_key(self.user.id))
+        with self.captureOnCommitCallbacks() as callbacks:
+            getattr(self.client, method)(url)
+        self.assertEqual(cache.get(version_key(self.user.id)), version)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(cache.get(version_key(self.user.id)), version)
+
+    def test_shopping_cart_changes(self):
+        self.assertFalse(self.in_cart())
+        self.change('post', self.url + 'shopping_cart/')
+        self.assertTrue(self.in_cart())
+        self.change('delete', self.url + 'shopping_cart/')
+        self.assertFalse(self.in_cart())
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+        self.change('delete', '/api/recipes/shopping_cart/clear/')
+        self.assertFalse(self.in_cart())
+
+    def test_evicted_version(self):
+        self.assertFalse(self.in_cart())
+        cache.delete(version_key(self.user.id))
+        self.change('post', self.url + 'shopping_cart/')
+        self.assertTrue(self.in_cart())
+
+    def test_delete_side_effects(self):
+        author = self.recipe.author
+        Subscription.objects.create(user=self.user, author=author)
+        self.assertTrue(FeedItem.objects.filter(user=self.user).exists())
+        self.change('delete', f'/api/users/{author.id}/subscribe/')
+        self.assertFalse(FeedItem.objects.filter(user=self.user).exists())
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        StaleRecipe.objects.all().delete()
+        self.change('delete', self.url + 'favorite/')
+        self.assertTrue(
+            StaleRecipe.objects.filter(recipe=self.recipe).exists()
+        )
+
+
+class BulkRecipeSetTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user('reader')
+        self.client = make_client(self.user)
+        author = make_user('author')
+        self.recipes = [make_recipe(author, f'Рецепт {i}') for i in range(3)]
+        self.ids = [recipe.id for recipe in self.recipes]
+
+    def send(self, method, url, ids, status_code=200):
+        response = getattr(self.client, method)(
+            url, {'recipes': ids}, format='json'
+        )
+        self.assertEqual(response.status_code, status_code)
+        return response
+
+    def ids_in(self, response):
+        return sorted(recipe['id'] for recipe in response.json())
+
+    def test_shopping_cart(self):
+        url = '/api/recipes/shopping_cart/'
+        first, second, third = self.ids
+        response = self.send('post', url, [first, second, first])
+        self.assertEqual(self.ids_in(response), [first, second])
+        response = self.send('post', url, [second, third])
+        self.assertEqual(self.ids_in(response), self.ids)
+        response = self.send('delete', url, [first, third])
+        self.assertEqual(self.ids_in(response), [second])
+        response = self.client.delete('/api/recipes/shopping_cart/clear/')
+        self.assertEqual(response.json(), [])
+
+    def test_favorite(self):
+        StaleRecipe.objects.all().delete()
+        response = self.send('post', '/api/recipes/favorite/', self.ids[:2])
+        self.assertEqual(self.ids_in(response), self.ids[:2])
+        self.assertEqual(
+            sorted(StaleRecipe.objects.values_list('recipe_id', flat=True)),
+            self.ids[:2],
+        )
+        response = self.client.get(f'/api/recipes/{self.ids[0]}/')
+        self.assertTrue(response.json()['is_favorited'])
+
+    def test_invalid(self):
+        url = '/api/recipes/shopping_cart/'
+        missing = max(self.ids) + 1
+        response = self.send('post', url, [self.ids[0], missing], 400)
+        self.assertIn(str(missing), str(response.json()['recipes']))
+        self.assertFalse(ShoppingCart.objects.exists())
+        self.send('post', url, [], 400)
+        self.send(
+            'post', url, list(range(1, settings.BULK_RECIPES_LIMIT + 2)), 400
+        )
+        self.assertEqual(
+            APIClient().post(
+                url, {'recipes': self.ids}, format='json'
+            ).status_code,
+            401,
+        )
+
+
+@override_settings(FEED_FANOUT_LIMIT=1)
+class FeedTests(TestCase):
+
+    def setUp(self):
+        self.author = make_user('author')
+        self.first = make_user('first')
+        self.second = make_user('second')
+
+    def feed(self, user):
+        response = make_client(user).get('/api/recipes/feed/?limit=10')
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def fanned_out(self, user):
+        return list(FeedItem.objects.filter(user=user).order_by(
+            '-recipe_id'
+        ).values_list('recipe_id', flat=True))
+
+    def test_fanout(self):
+        old = make_recipe(self.author)
+        Subscription.objects.create(user=self.first, author=self.author)
+        new = make_recipe(self.author)
+        self.assertEqual(self.fanned_out(self.first), [new.id, old.id])
+        self.assertEqual(self.feed(self.first), [new.id, old.id])
+        self.assertEqual(self.feed(self.second), [])
+
+    def test_popular_author(self):
+        old = make_recipe(self.author)
+        Subscription.objects.create(user=self.first, author=self.author)
+        Subscription.objects.create(user=self.second, author=self.author)
+        self.assertTrue(
+            PopularAuthor.objects.filter(author=self.author).exists()
+        )
+        new = make_recipe(self.author)
+        self.assertEqual(self.fanned_out(self.first), [old.id])
+        self.assertEqual(self.fanned_out(self.second), [])
+        self.assertEqual(self.feed(self.first), [new.id, old.id])
+        self.assertEqual(self.feed(self.second), [new.id, old.id])
+
+        make_client(self.first).delete(
+            f'/api/users/{self.author.id}/subscribe/'
+        )
+        self.assertFalse(PopularAuthor.objects.exists())
+        self.assertEqual(self.fanned_out(self.second), [new.id, old.id])
+        self.assertEqual(self.feed(self.second), [new.id, old.id])
+        self.assertEqual(self.feed(self.first), [])
+
+
+class SimilarRecipesTests(TestCase):
+
+    def setUp(self):
+        author = make_user('author')
+        self.recipes = [make_recipe(author, f'Рецепт {i}') for i in range(3)]
+        self.users = [make_user(f'reader{i}') for i in range(3)]
+        for user, positions in zip(self.users, ((0, 1), (0, 1), (1, 2))):
+            for position in positions:
+                Favorite.objects.create(
+                    user=user, recipe=self.recipes[position]
+                )
+
+    def similar(self, recipe):
+        return [
+            item['id'] for item in make_client().get(
+                f'/api/recipes/{recipe.id}/similar/'
+            ).json()
+        ]
+
+    def test_full(self):
+        first, second, third = self.recipes
+        self.assertEqual(refresh_similar(full=True), 3)
+        self.assertFalse(StaleRecipe.objects.exists())
+        self.assertEqual(self.similar(first), [second.id])
+        self.assertEqual(self.similar(second), [first.id, third.id])
+        self.assertAlmostEqual(
+            SimilarRecipe.objects.get(recipe=first, similar=second).score,
+            2 / math.sqrt(2 * 3),
+        )
+
+    def test_incremental(self):
+        first, second, third = self.recipes
+        refresh_similar(full=True)
+        self.assertEqual(refresh_similar(), 0)
+        Favorite.objects.create(user=self.users[2], recipe=first)
+        self.assertEqual(refresh_similar(), 3)
+        self.assertEqual(self.similar(third), [first.id, second.id])
+        self.assertEqual(
+            SimilarRecipe.objects.filter(recipe=first).count(), 2
+        )
+
+    def test_marked_during_refresh(self):
+        first, _, third = self.recipes
+        mark_stale([first.id])
+
+        def compute(*args, **kwargs):
+            mark_stale([first.id, third.id])
+            return compute_similar(*args, **kwargs)
+
+        with mock.patch('recipes.similarity.compute_similar', compute):
+            refresh_similar()
+        self.assertEqual(
+            set(StaleRecipe.objects.values_list('recipe_id', flat=True)),
+            {first.id, third.id},
+        )
+
+
+class NutritionTests(TestCase):
+
+    def setUp(self):
+        author = make_user('author')
+        self.flour = Ingredient.objects.create(
+            name='Мука', measurement_unit='г', calories=3, proteins=0.1,
+            price='0.10',
+        )
+        egg = Ingredient.objects.create(
+            name='Яйцо', measurement_unit='шт', calories=70,
+        )
+        self.cake = make_recipe(
+            author, 'Пирог', ingredients=[(self.flour, 100), (egg, 2)]
+        )
+        self.omelette = make_recipe(author, 'Омлет', ingredients=[(egg, 3)])
+        self.empty = make_recipe(author, 'Без ингредиентов')
+        update_recipe_totals(
+            [self.cake.id, self.omelette.id, self.empty.id]
+        )
+
+    def test_totals(self):
+        self.cake.refresh_from_db()
+        self.assertEqual(self.cake.calories, 440)
+        self.assertAlmostEqual(self.cake.proteins, 10)
+        self.assertEqual(self.cake.cost, Decimal('10.00'))
+        self.omelette.refresh_from_db()
+        self.assertEqual(self.omelette.calories, 210)
+        self.assertIsNone(self.omelette.cost)
+        self.empty.refresh_from_db()
+        self.assertIsNone(self.empty.calories)
+
+    def test_ingredient_change(self):
+        self.flour.calories = 4
+        self.flour.save(update_fields=['calories'])
+        self.cake.refresh_from_db()
+        self.assertEqual(self.cake.calories, 540)
+
+    def test_filters(self):
+        client = make_client()
+        for query, recipes in (
+            ('min_calories=300', [self.cake]),
+            ('max_calories=300', [self.omelette]),
+            ('min_calories=200&max_calories=500', [self.cake, self.omelette]),
+            ('min_cost=5', [self.cake]),
+            ('max_cost=5', []),
+        ):
+            with self.subTest(query=query):
+                response = client.get('/api/recipes/?' + query)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    sorted(recipe['id'] for recipe in response.json()),
+                    sorted(recipe.id for recipe in recipes),
+                )
+
+
+@override_settings(ANON_CACHE_TTL=60, ALLOWED_HOSTS=['*'])
+class AnonymousCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.ingredient = Ingredient.objects.create(
+            name='Мука', measurement_unit='г', calories=3
+        )
+        self.recipe = make_recipe(
+            make_user('author'), ingredients=[(self.ingredient, 100)]
+        )
+        update_recipe_totals([self.recipe.id])
+        self.client = make_client()
+
+    def test_key_includes_host(self):
+        first = self.client.get('/api/recipes/', HTTP_HOST='one.example')
+        second = self.client.get('/api/recipes/', HTTP_HOST='two.example')
+        self.assertIn('one.example', first.json()[0]['image'])
+        self.assertIn('two.example', second.json()[0]['image'])
+
+    def test_nutrition_update_invalidates(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        self.assertEqual(self.client.get(url).json()['calories'], 300)
+        Ingredient.objects.filter(id=self.ingredient.id).update(calories=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            update_ingredient_recipes([self.ingredient.id])
+        self.assertEqual(self.client.get(url).json()['calories'], 500)
+
+    def test_author_changes(self):
+        author = self.recipe.author
+        version = get_version(self.recipe.id)
+        author.last_login = author.date_joined
+        author.set_password('Password-54321')
+        for update_fields in (None, ['last_login'], ['first_name']):
+            with self.subTest(update_fields=update_fields):
+                with self.captureOnCommitCallbacks(execute=True):
+                    author.save(update_fields=update_fields)
+                self.assertEqual(get_version(self.recipe.id), version)
+        author.first_name = 'Автор'
+        with self.captureOnCommitCallbacks(execute=True):
+            author.save(update_fields=['first_name'])
+        self.assertNotEqual(get_version(self.recipe.id), version)
+
+    def test_invalidated_on_commit(self):
+        tag = Tag.objects.create(name='Ужин', color='#8775D2', slug='dinner')
+        version = get_version(self.recipe.id)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.recipe.tags.add(tag)
+            self.recipe.save()
+        self.assertEqual(get_version(self.recipe.id), version)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_version(self.recipe.id), version)
+
+    def test_detail_key(self):
+        request = Request(RequestFactory().get('/'))
+        self.assertEqual(
+            detail_key(request, f'0{self.recipe.id}'),
+            detail_key(request, str(self.recipe.id)),
+        )
+        self.assertEqual(
+            self.client.get('/api/recipes/abc/').status_code, 404
+        )
+
+
+@override_settings(RECIPE_FRAGMENT_CACHE_TTL=0, ANON_CACHE_TTL=0)
+class FastSerializerParityTests(TestCase):
+    """Быстрые сериализаторы из api/fast.py отдают тот же JSON."""
+
+    def setUp(self):
+        cache.clear()
+        author = make_user('author')
+        self.user = make_user('reader')
+        breakfast = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast'
+        )
+        dinner = Tag.objects.create(
+            name='Ужин', color='#8775D2', slug='dinner'
+        )
+        flour = Ingredient.objects.create(
+            name='Мука', measurement_unit='г', calories=3.64,
+            proteins=0.1, fats=0.01, carbohydrates=0.76, price='0.07',
+        )
+        salt = Ingredient.objects.create(name='Соль', measurement_unit='г')
+        recipes = [
+            make_recipe(author, 'Блины', (breakfast, dinner),
+                        ((flour, 200), (salt, 5))),
+            make_recipe(author, 'Суп', (dinner,), ((salt, 10),)),
+            make_recipe(self.user, 'Пустой'),
+        ]
+        update_recipe_totals([recipe.id for recipe in recipes])
+        Favorite.objects.create(user=self.user, recipe=recipes[0])
+        ShoppingCart.objects.create(user=self.user, recipe=recipes[1])
+        Subscription.objects.create(user=self.user, author=author)
+
+    def render(self, url, user=None):
+        bodies = []
+        for fast in (False, True):
+            with override_settings(FAST_SERIALIZERS=fast):
+                response = make_client(user).get(url)
+            self.assertEqual(response.status_code, 200)
+            bodies.append(response.json())
+        return bodies
+
+    def test_api_responses(self):
+        for url in ('/api/tags/', '/api/recipes/', '/api/recipes/?limit=2',
+                    '/api/recipes/feed/', '/api/users/subscriptions/'):
+            for user in (None, self.user):
+                if user is None and url.startswith('/api/users/'):
+                    continue
+                if user is None and url.endswith('feed/'):
+                    continue
+                with self.subTest(url=url, user=user):
+                    regular, fast = self.render(url, user)
+                    self.assertEqual(regular, fast)
+
+    def test_rendered_bytes(self):
+        recipes = Recipe.objects.order_by('-id')
+        request = Request(RequestFactory().get('/api/recipes/'))
+        request.user = self.user
+        for serializer_class, queryset in (
+            (RecipeShowSerializer, recipes),
+            (RecipeListRetrieveSerializer, recipes),
+            (TagSerializer, Tag.objects.all()),
+        ):
+            bodies = []
+            for fast, renderer in ((False, JSONRenderer()),
+                                   (True, FastJSONRenderer())):
+                with override_settings(FAST_SERIALIZERS=fast):
+                    for data in (queryset, list(queryset)):
+                        bodies.append(renderer.render({
+                            'results': serializer_class(
+                                data, many=True, context={'request': request}
+                            ).data,
+                            'updated_at': recipes[0].updated_at,
+                            'score': 1 / 3,
+                        }))
+            with self.subTest(serializer=serializer_class.__name__):
+                self.assertEqual(bodies[:2], bodies[2:])
+
+
+@override_settings(SHARED_CACHE=True)
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('reader')
+        self.recipe = make_recipe(make_user('author'))
+
+    def revalidate(self, url, client, etag):
+        return client.get(url, HTTP_IF_NONE_MATCH=etag).status_code
+
+    def check(self, url, change, user=None):
+        client = make_client(user)
+        etag = client.get(url)['ETag']
+        self.assertEqual(self.revalidate(url, client, etag), 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertEqual(self.revalidate(url, client, etag), 200)
+
+    def test_recipes(self):
+        self.check('/api/recipes/', lambda: make_recipe(self.user))
+        self.check(
+            f'/api/recipes/{self.recipe.id}/',
+            lambda: Recipe.objects.get(id=self.recipe.id).save(),
+        )
+
+    def test_memberships(self):
+        self.check(
+            f'/api/recipes/{self.recipe.id}/',
+            lambda: Favorite.objects.create(
+                user=self.user, recipe=self.recipe
+            ),
+            self.user,
+        )
+
+    def test_catalogs(self):
+        self.check('/api/tags/', lambda: Tag.objects.create(
+            name='Обед', color='#49B64E', slug='lunch'
+        ))
+        self.check('/api/ingredients/', lambda: Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        ))
+
+    def test_invalid_pk(self):
+        response = make_client().get('/api/recipes/abc/')
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_local_cache(self):
+        response = make_client().get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+
+@override_settings(SHARED_CACHE=True, RECIPE_INDEX_TTL=60)
+class BulkDeleteTests(TestCase):
+    """bulk_delete удаляет то же, что QuerySet.delete(), и сбрасывает кеши."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = make_user('author')
+        self.reader = make_user('reader')
+        self.other = make_user('other')
+        tag = Tag.objects.create(name='Ужин', color='#8775D2', slug='dinner')
+        ingredient = Ingredient.objects.create(
+            name='Мука', measurement_unit='г'
+        )
+        self.recipes = [
+            make_recipe(self.author, f'Рецепт {i}', [tag], [(ingredient, 10)])
+            for i in range(3)
+        ]
+        for position, recipe in enumerate(self.recipes):
+            recipe.image = f'recipes/{position}.png'
+            recipe.save()
+        kept = make_recipe(self.other, tags=[tag])
+        for user in (self.reader, self.other):
+            Subscription.objects.create(user=user, author=self.author)
+            Favorite.objects.create(user=user, recipe=self.recipes[0])
+            ShoppingCart.objects.create(user=user, recipe=self.recipes[1])
+        Subscription.objects.create(user=self.author, author=self.other)
+        Favorite.objects.create(user=self.author, recipe=kept)
+        Token.objects.create(user=self.author)
+        self.models = (
+            User, Recipe, Recipe.tags.through, IngredientRecipe, Favorite,
+            ShoppingCart, Subscription, FeedItem, Token, Tag, Ingredient,
+        )
+
+    def rows(self):
+        return {
+            model._meta.label: model.objects.count() for model in self.models
+        }
+
+    def check(self, queryset):
+        with transaction.atomic():
+            _, expected = queryset.delete()
+            expected_rows = self.rows()
+            transaction.set_rollback(True)
+        versions = {
+            key: cache.get_or_set(key, 1, None) for key in (
+                version_key(self.reader.id),
+                version_key(self.other.id),
+                index.version_key(index.AUTHOR, self.author.id),
+            )
+        }
+        with mock.patch(
+            'recipes.deletion.default_storage.delete'
+        ) as delete_file:
+            with self.captureOnCommitCallbacks(execute=True):
+                deleted = bulk_delete(queryset, batch_size=2)
+        self.assertEqual(
+            dict(+deleted),
+            {label: count for label, count in expected.items() if count},
+        )
+        self.assertEqual(self.rows(), expected_rows)
+        for key, version in versions.items():
+            self.assertNotEqual(cache.get(key), version, key)
+        self.assertEqual(
+            sorted(call.args[0] for call in delete_file.call_args_list),
+            [f'recipes/{position}.png' for position in range(3)],
+        )
+
+    def test_users(self):
+        self.check(User.objects.filter(id=self.author.id))
+
+    def test_recipes(self):
+        self.check(Recipe.objects.filter(author=self.author))
+
+
+@override_settings(SHARED_CACHE=True, RECIPE_INDEX_TTL=60)
+class RecipeImportTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = make_user('author')
+        self.tag = Tag.objects.create(
+            name='Ужин', color='#8775D2', slug='dinner'
+        )
+        Ingredient.objects.create(
+            name='Мука', measurement_unit='г', calories=3, price='0.5'
+        )
+
+    def line(self, **fields):
+        return json.dumps({
+            'name': 'Блины',
+            'author': self.author.email,
+            'text': 'Текст',
+            'cooking_time': 10,
+            'image': 'recipes/test.png',
+            'tags': ['dinner'],
+            'ingredients': [
+                {'name': 'Мука', 'measurement_unit': 'г', 'amount': 200}
+            ],
+            **fields
+        }, ensure_ascii=False)
+
+    def test_validation(self):
+        importer = RecipeImporter()
+        version = cache.get_or_set(
+            index.version_key(index.TAG, self.tag.id), 1, None
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            created = importer.run([
+                self.line(),
+                self.line(ingredients=[
+                    {'name': 'Мука', 'measurement_unit': 'г', 'amount': 0}
+                ]),
+                self.line(name='Б' * 201),
+                self.line(name=' '),
+                self.line(tags=['lunch']),
+                '{',
+            ])
+        self.assertEqual(created, 1)
+        self.assertEqual(
+            sorted(number for number, _ in importer.errors), [2, 3, 4, 5, 6]
+        )
+        recipe = Recipe.objects.get()
+        self.assertEqual((recipe.calories, recipe.cost), (600, 100))
+        self.assertEqual(list(recipe.tags.all()), [self.tag])
+        self.assertNotEqual(
+            cache.get(index.version_key(index.TAG, self.tag.id)), version
+        )
+
+    def test_database_error(self):
+        importer = RecipeImporter(chunk_size=2)
+        save = importer.save
+        calls = []
+
+        def fail_first(batch):
+            calls.append(batch)
+            if len(calls) == 1:
+                raise DatabaseError('deadlock detected')
+            save(batch)
+
+        with mock.patch.object(importer, 'save', fail_first):
+            created = importer.run([self.line()] * 5)
+        self.assertEqual(created, 3)
+        self.assertEqual(Recipe.objects.count(), 3)
+        self.assertEqual([number for number, _ in importer.errors], [1, 2])
+
+
+class SubscriptionListTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('reader')
+        self.client = make_client(self.user)
+        self.recipes = {}
+        for position in range(4):
+            self.subscribe(position)
+
+    def subscribe(self, position):
+        author = make_user(f'author{position}')
+        self.recipes[author.id] = [
+            make_recipe(author, f'Рецепт {i}').id for i in range(3)
+        ]
+        Subscription.objects.create(user=self.user, author=author)
+
+    def get(self, query):
+        response = self.client.get('/api/users/subscriptions/?' + query)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_fields(self):
+        authors = self.get('limit=10&fields=id,recipes&recipes_limit=2')
+        for author in authors:
+            self.assertEqual(set(author), {'id', 'recipes'})
+            self.assertEqual(
+                author['recipes'], self.recipes[author['id']][:2]
+            )
+        authors = self.get('limit=10&fields=id,recipes&expand=recipes')
+        self.assertEqual(
+            set(authors[0]['recipes'][0]),
+            {'id', 'name', 'image', 'cooking_time'},
+        )
+        self.assertEqual(
+            [set(author) for author in self.get('limit=10&fields=id')],
+            [{'id'}] * 4,
+        )
+        author = self.get('limit=1')[0]
+        self.assertEqual(len(author['recipes']), 3)
+        self.assertEqual(author['recipes_count'], 3)
+
+    def test_query_count(self):
+        for query in ('limit=10', 'limit=10&fields=id,recipes'):
+            with self.subTest(query=query):
+                self.get(query)
+                with CaptureQueriesContext(connection) as before:
+                    self.get(query)
+                self.subscribe(len(self.recipes))
+                with CaptureQueriesContext(connection) as after:
+                    self.get(query)
+                self.assertEqual(len(after), len(before))
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = make_user('reader')
+        self.author = make_user('author')
+        self.recipe = make_recipe(self.author)
+        default_storage.save(self.recipe.image.name, ContentFile(b'png'))
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        Subscription.objects.create(user=self.user, author=self.author)
+
+    def get(self, client, url, **extra):
+        response = client.get(url, **extra)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content), response
+
+    def test_ndjson(self):
+        content, response = self.get(
+            make_client(self.user), '/api/users/me/export/'
+        )
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(
+            [record['type'] for record in records],
+            ['user', 'favorite', 'subscription'],
+        )
+        self.assertEqual(records[1]['recipe']['id'], self.recipe.id)
+
+    def test_zip(self):
+        content, response = self.get(
+            make_client(self.author), '/api/users/me/export/?archive=zip',
+            HTTP_ACCEPT_ENCODING='gzip, br',
+        )
+        self.assertFalse(response.has_header('Content-Encoding'))
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(
+                archive.read(f'media/{self.recipe.image.name}'), b'png'
+            )
+            records = [
+                json.loads(line)
+                for line in archive.read('data.ndjson').splitlines()
+            ]
+        self.assertEqual(
+            [record['type'] for record in records], ['user', 'recipe']
+        )
+
+    def test_staff_only(self):
+        url = f'/api/users/{self.user.id}/export/'
+        self.assertEqual(APIClient().get(url).status_code, 401)
+        self.assertEqual(make_client(self.author).get(url).status_code, 403)
+        admin = make_user('admin')
+        admin.is_staff = True
+        admin.save()
+        content, _ = self.get(make_client(admin), url)
+        self.assertEqual(
+            json.loads(content.splitlines()[0])['email'], self.user.email
+        )
+
+
+class BatchRecipesTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = make_user('author')
+        other = make_user('other')
+        self.first, self.second, self.third = (
+            make_recipe(self.author, 'Первый').id,
+            make_recipe(self.author, 'Второй').id,
+            make_recipe(other, 'Третий').id,
+        )
+        self.client = make_client()
+
+    def get(self, query, status_code=200):
+        response = self.client.get('/api/recipes/?' + query)
+        self.assertEqual(response.status_code, status_code)
+        return response.json()
+
+    def test_order(self):
+        first, second, third = self.first, self.second, self.third
+        for ids, expected in (
+            (f'{third},{first},{second}', [third, first, second]),
+            (f'{second},{first},{second}', [second, first]),
+            (f'{first}, {third},', [first, third]),
+            (f'{third + 1},{first}', [first]),
+        ):
+            with self.subTest(ids=ids):
+                self.assertEqual(
+                    [recipe['id'] for recipe in self.get(f'ids={ids}')],
+                    expected,
+                )
+        recipes = self.get(
+            f'ids={third},{second},{first}&author={self.author.id}'
+        )
+        self.assertEqual(
+            [recipe['id'] for recipe in recipes], [second, first]
+        )
+
+    @override_settings(BULK_RECIPES_LIMIT=2)
+    def test_invalid(self):
+        self.assertIn('ids', self.get(f'ids={self.first},x', 400))
+        self.assertIn('ids', self.get(
+            f'ids={self.first},{self.second},{self.third}', 400
+        ))
+        self.assertEqual(
+            len(self.get(f'ids={self.first},{self.second},{self.first}')),
+            2,
+        )
+
+
+class InlineExecutor:
+    """Строит списки индекса сразу, в потоке теста."""
+
+    def submit(self, function, *args):
+        function(*args)
+
+
+@override_settings(SHARED_CACHE=True, RECIPE_INDEX_TTL=60, ANON_CACHE_TTL=0)
+@mock.patch.object(index, 'connections', mock.Mock())
+@mock.patch.object(index, 'executor', InlineExecutor())
+class RecipeIndexTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.first = make_user('first')
+        self.second = make_user('second')
+        self.breakfast, self.dinner, self.lunch = (
+            Tag.objects.create(name=slug, color=color, slug=slug)
+            for slug, color in (
+                ('breakfast', '#E26C2D'),
+                ('dinner', '#8775D2'),
+                ('lunch', '#49B64E'),
+            )
+        )
+        self.recipes = [
+            make_recipe(self.first, tags=[self.breakfast]),
+            make_recipe(self.second, tags=[self.dinner]),
+            make_recipe(self.first, tags=[self.breakfast, self.dinner]),
+            make_recipe(self.second, tags=[self.lunch]),
+        ]
+
+    def ids(self, *positions):
+        return [self.recipes[position].id for position in positions]
+
+    def lookup(self, tags, author=None):
+        """Первый вызов строит недостающие списки, второй читает индекс."""
+        tag_ids = [tag.id for tag in tags]
+        author_id = author and author.id
+        index.lookup(tag_ids, author_id)
+        return list(index.lookup(tag_ids, author_id))
+
+    def test_lookup(self):
+        self.assertEqual(
+            self.lookup([self.breakfast, self.dinner]), self.ids(0, 1, 2)
+        )
+        self.assertEqual(
+            self.lookup([self.breakfast, self.dinner], self.first),
+            self.ids(0, 2),
+        )
+        self.assertEqual(self.lookup([self.lunch], self.first), [])
+        self.assertEqual(self.lookup([], self.second), self.ids(1, 3))
+
+    def test_pages(self):
+        url = '/api/recipes/?tags=breakfast&tags=dinner&limit=2'
+        client = make_client()
+        self.lookup([self.breakfast, self.dinner])
+        self.lookup([self.lunch], self.first)
+        with mock.patch.object(
+            index, 'IndexedRecipes', wraps=index.IndexedRecipes
+        ) as indexed:
+            first = client.get(url).json()
+            second = client.get(url + '&page=2').json()
+            empty = client.get(
+                '/api/recipes/?tags=lunch&author=' + str(self.first.id)
+            ).json()
+        self.assertEqual(indexed.call_count, 3)
+        self.assertEqual(first['count'], 3)
+        self.assertEqual(
+            [recipe['id'] for recipe in first['results']], self.ids(2, 1)
+        )
+        self.assertEqual(
+            [recipe['id'] for recipe in second['results']], self.ids(0)
+        )
+        self.assertEqual(empty, [])
+
+    def test_invalidation(self):
+        self.assertEqual(self.lookup([self.lunch]), self.ids(3))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipes.append(make_recipe(self.first, tags=[self.lunch]))
+        self.assertEqual(self.lookup([self.lunch]), self.ids(3, 4))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipes[3].tags.remove(self.lunch)
+        self.assertEqual(self.lookup([self.lunch]), self.ids(4))
+
+    @override_settings(SHARED_CACHE=False)
+    def test_local_cache(self):
+        self.assertFalse(index.is_enabled())
+
+
+@override_settings(SHED_WINDOW=0, SHED_MAX_QUEUE_MS=100)
+class LoadSheddingTests(TestCase):
+
+    def test_queue_time(self):
+        client = make_client()
+        for queued, status_code in ((1, 503), (0, 200)):
+            with self.subTest(queued=queued):
+                response = client.get(
+                    '/api/ingredients/',
+                    HTTP_X_REQUEST_START=f't={time.time() - queued:.3f}'
+                )
+                self.assertEqual(response.status_code, status_code)
+        self.assertEqual(client.get('/api/ingredients/').status_code, 200)
+        self.assertEqual(
+            client.get('/api/users/', HTTP_X_REQUEST_START='t=1').status_code,
+            200,
+        )
+
+
+class MetricsTests(TestCase):
+
+    def serializer_time(self, route):
+        return registry.counters[
+            'foodgram_serializer_duration_seconds_total',
+            (('route', route),),
+        ]
+
+    @override_settings(PERF_METRICS_TOKEN='secret')
+    def test_token(self):
+        client = APIClient()
+        for authorization, status_code in (
+            ('Bearer secret', 200),
+            ('Bearer wrong', 404),
+            ('Bearer secretё', 404),
+            ('', 404),
+        ):
+            with self.subTest(authorization=authorization):
+                response = client.get(
+                    '/api/metrics/', HTTP_AUTHORIZATION=authorization
+                )
+                self.assertEqual(response.status_code, status_code)
+
+    def test_serializer_time(self):
+        author = make_user('author')
+        make_recipe(author)
+        client = make_client()
+        for url, route in (
+            ('/api/recipes/', 'api:recipes-list'),
+            ('/api/recipes/{}/similar/', 'api:recipes-similar'),
+        ):
+            with self.subTest(url=url):
+                before = self.serializer_time(route)
+                response = client.get(
+                    url.format(Recipe.objects.get().id)
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertGreater(self.serializer_time(route), before)
+
+    def test_outside_request(self):
+        serializer = TagSerializer(Tag.objects.none(), many=True)
+        self.assertIs(timed(serializer), serializer)
+        self.assertNotIn('to_representation', vars(serializer))
+
+
+class ProfilingTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = override_settings(
+            PROFILING_DIR=self.directory, PROFILING_SAMPLE_RATE=0
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = make_client()
+
+    def profile(self, value):
+        self.client.get('/api/tags/', HTTP_X_PROFILE=value)
+        return len(os.listdir(self.directory))
+
+    def test_token(self):
+        stdout = io.StringIO()
+        call_command('profiling_token', stdout=stdout, stderr=io.StringIO())
+        token = stdout.getvalue().strip()
+        self.assertEqual(self.profile('profile'), 0)
+        self.assertEqual(
+            self.profile(signing.TimestampSigner().sign('profile')), 0
+        )
+        self.assertEqual(self.profile(token), 1)
+        time.sleep(0.01)
+        with self.settings(PROFILING_TOKEN_MAX_AGE=0):
+            self.assertEqual(self.profile(token), 1)
+
+    @override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_MAX_FILES=1)
+    def test_sampling(self):
+        self.assertEqual(self.profile(''), 1)
+        self.assertEqual(self.profile(''), 1)
+        self.assertTrue(os.listdir(self.directory)[0].endswith('.prof'))
+
+
+@override_settings(ROOT_URLCONF=__name__, SHARED_CACHE=True)
+class AsyncViewTests(TransactionTestCase):
+    """Маршруты режима ASGI обслуживают те же ViewSet."""
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Нужна файловая БД SQLite (DB_TEST_NAME).')
+        cache.clear()
+        Tag.objects.create(name='Ужин', color='#8775D2', slug='dinner')
+        Ingredient.objects.create(name='Мука', measurement_unit='г')
+        Ingredient.objects.create(name='Соль', measurement_unit='г')
+        self.recipe = make_recipe(make_user('author'))
+
+    async def test_routes(self):
+        client = AsyncClient()
+        for url, name in (
+            ('/api/tags/', 'api:tag-list'),
+            ('/api/ingredients/', 'api:ingredient-list'),
+            ('/api/recipes/', 'api:recipes-list'),
+            (f'/api/recipes/{self.recipe.id}/', 'api:recipes-detail'),
+        ):
+            with self.subTest(url=url):
+                response = await client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.resolver_match.view_name, name)
+                response = await client.get(
+                    url, **{'If-None-Match': response['ETag']}
+                )
+                self.assertEqual(response.status_code, 304)
+
+    async def test_ingredient_search(self):
+        response = await AsyncClient().get(
+            '/api/ingredients/?' + urlencode({'name': 'Му'})
+        )
+        self.assertEqual(
+            [ingredient['name'] for ingredient in response.json()], ['Мука']
+        )
+
+    async def test_throttling(self):
+        client = AsyncClient()
+        with mock.patch.dict(TokenBucketThrottle.THROTTLE_RATES, {
+            'ingredients': '1/min'
+        }):
+            first = await client.get('/api/ingredients/')
+            second = await client.get('/api/ingredients/')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 429)
+
+    async def test_load_shedding(self):
+        with self.settings(SHED_MAX_IN_FLIGHT=0):
+            response = await AsyncClient().get('/api/ingredients/')
+        self.assertEqual(response.status_code, 503)
+
+    async def test_concurrent_reads(self):
+        """Медленные безопасные запросы не ждут друг друга."""
+        delay, count = 0.2, 5
+        list_view = RecipeViewSet.list
+
+        def slow_list(viewset, *args, **kwargs):
+            time.sleep(delay)
+            return list_view(viewset, *args, **kwargs)
+
+        client = AsyncClient()
+        with mock.patch.object(RecipeViewSet, 'list', slow_list):
+            start = time.perf_counter()
+            responses = await asyncio.gather(*(
+                client.get('/api/recipes/') for _ in range(count)
+            ))
+            elapsed = time.perf_counter() - start
+        self.assertEqual(
+            [response.status_code for response in responses], [200] * count
+        )
+        self.assertLess(elapsed, delay * count / 2)
+
+
+@unittest.skipUnless(
+    REPLICA in settings.DATABASES, 'Нужна реплика (DB_REPLICA_NAME).'
+)
+@override_settings(ANON_CACHE_TTL=0, RECIPE_FRAGMENT_CACHE_TTL=0)
+class ReplicaRoutingTests(TransactionTestCase):
+    """Реплика в тестах — второе соединение с той же БД (TEST MIRROR)."""
+
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('reader')
+        self.recipe = make_recipe(make_user('author'))
+
+    def tables(self, client, method, url):
+        """Таблицы recipes_recipe в SQL каждого соединения за запрос."""
+        with CaptureQueriesContext(connections['default']) as default:
+            with CaptureQueriesContext(connections[REPLICA]) as replica:
+                response = getattr(client, method)(url)
+        self.assertFalse(use_replica.get())
+        return response, {
+            alias: any('recipes_recipe' in query['sql']
+                       for query in queries.captured_queries)
+            for alias, queries in (('default', default), (REPLICA, replica))
+        }
+
+    def test_reads(self):
+        for url in ('/api/recipes/', f'/api/recipes/{self.recipe.id}/',
+                    '/api/recipes/999999/'):
+            with self.subTest(url=url):
+                _, used = self.tables(make_client(), 'get', url)
+                self.assertEqual(used, {'default': False, REPLICA: True})
+
+    def test_writes_pin_reads_to_default(self):
+        client = make_client(self.user)
+        url = f'/api/recipes/{self.recipe.id}/'
+        response, used = self.tables(client, 'post', url + 'favorite/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(used, {'default': True, REPLICA: False})
+        _, used = self.tables(client, 'get', url)
+        self.assertEqual(used, {'default': True, REPLICA: False})
+
+    def test_pin_without_cookie(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        for shared, pinned in ((False, REPLICA), (True, 'default')):
+            with self.subTest(shared=shared):
+                client = make_client(self.user)
+                with override_settings(SHARED_CACHE=shared):
+                    self.tables(client, 'post', url + 'shopping_cart/')
+                    client.cookies.clear()
+                    _, used = self.tables(client, 'get', url)
+                    client.delete(url + 'shopping_cart/')
+                self.assertEqual(
+                    used, {'default': pinned == 'default',
+                           REPLICA: pinned == REPLICA}
+                )
+
+    def test_transaction_reads_default(self):
+        token = use_replica.set(True)
+        try:
+            self.assertEqual(Recipe.objects.all().db, REPLICA)
+            with transaction.atomic():
+                self.assertEqual(Recipe.objects.all().db, 'default')
+        finally:
+            use_replica.reset(token)
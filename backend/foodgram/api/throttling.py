@@ -0,0 +1,93 @@
+"""Ограничение частоты запросов к дорогим эндпоинтам.
+
+Ставки задаются в REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] для области
+throttle_scope представления: по пользователю (для анонимов — по IP)
+и отдельно по IP с суффиксом _ip. Ставка N/период означает корзину на
+N запросов, которая заполняется заново за период, поэтому короткие
+всплески проходят, а постоянная нагрузка выше ставки — нет. Корзина
+читается и записывается под блокировкой на ключ, иначе параллельные
+запросы потратили бы один и тот же токен.
+"""
+import time
+
+from django.conf import settings
+from rest_framework.throttling import ScopedRateThrottle
+
+from .metrics import registry
+
+LOCK_TIMEOUT = 1
+LOCK_ATTEMPTS = 20
+LOCK_DELAY = 0.005
+
+
+def is_deep_page(request):
+    """Запрошена страница списка дальше DEEP_PAGE_THRESHOLD."""
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        return False
+    return page > settings.DEEP_PAGE_THRESHOLD
+
+
+class TokenBucketThrottle(ScopedRateThrottle):
+    """Token bucket в кеше по пользователю, для анонимов — по IP."""
+
+    cache_format = 'throttle:%(scope)s:%(ident)s'
+    scope_suffix = ''
+
+    def allow_request(self, request, view):
+        scope = getattr(view, self.scope_attr, None)
+        if not scope:
+            return True
+        self.scope = scope + self.scope_suffix
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        lock = f'{self.key}:lock'
+        if self.acquire(lock):
+            try:
+                allowed = self.take_token()
+            finally:
+                self.cache.delete(lock)
+        else:
+            self.tokens = 0
+            allowed = False
+        if not allowed:
+            registry.inc('foodgram_throttled_total', (('scope', self.scope),))
+        return allowed
+
+    def acquire(self, lock):
+        for _ in range(LOCK_ATTEMPTS):
+            if self.cache.add(lock, 1, LOCK_TIMEOUT):
+                return True
+            time.sleep(LOCK_DELAY)
+        return False
+
+    def take_token(self):
+        now = self.timer()
+        tokens, updated = self.cache.get(self.key, (self.num_requests, now))
+        tokens = min(
+            self.num_requests,
+            tokens + (now - updated) * self.num_requests / self.duration
+        )
+        allowed = tokens >= 1
+        self.tokens = tokens - 1 if allowed else tokens
+        self.cache.set(self.key, (self.tokens, now), self.duration)
+        return allowed
+
+    def wait(self):
+        return (1 - self.tokens) * self.duration / self.num_requests
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    """Token bucket по IP для всех клиентов, ставка области с _ip."""
+
+    scope_suffix = '_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': self.get_ident(request),
+        }
@@ -0,0 +1,75 @@
+from collections import defaultdict
+from fractions import Fraction
+
+MASS = 'mass'
+VOLUME = 'volume'
+
+UNITS = {
+    'г': (MASS, Fraction(1)),
+    'кг': (MASS, Fraction(1000)),
+    'мл': (VOLUME, Fraction(1)),
+    'л': (VOLUME, Fraction(1000)),
+    'ч. л.': (VOLUME, Fraction(5)),
+    'ст. л.': (VOLUME, Fraction(15)),
+    'стакан': (VOLUME, Fraction(250)),
+}
+METRIC_UNITS = {
+    MASS: ('г', 'кг'),
+    VOLUME: ('мл', 'л'),
+}
+
+
+def normalize_unit(unit):
+    """Возвращает размерность единицы и её множитель к базовой единице.
+
+    Единицы, которых нет в таблице, считаются отдельной размерностью
+    и складываются только сами с собой.
+    """
+    return UNITS.get(unit, (unit, Fraction(1)))
+
+
+def choose_unit(dimension, total, units):
+    """Выбирает самую крупную из подходящих единиц.
+
+    Подходит единица, в которой количество не меньше 1 и записывается
+    не более чем двумя знаками после запятой. Для граммов и миллилитров
+    дополнительно допускаются килограммы и литры.
+    """
+    candidates = set(units)
+    if candidates & set(METRIC_UNITS.get(dimension, ())):
+        candidates.update(METRIC_UNITS[dimension])
+    candidates = sorted(
+        candidates, key=lambda unit: normalize_unit(unit)[1], reverse=True
+    )
+    for unit in candidates:
+        amount = total / normalize_unit(unit)[1]
+        if amount >= 1 and (amount * 100).denominator == 1:
+            return unit, amount
+    unit = candidates[-1]
+    return unit, total / normalize_unit(unit)[1]
+
+
+def format_amount(amount):
+    if amount.denominator == 1:
+        return str(amount.numerator)
+    return f'{float(amount):.2f}'.rstrip('0').rstrip('.')
+
+
+def consolidate(rows):
+    """Сводит строки (название, единица, количество) в список покупок.
+
+    Количества одного ингредиента в совместимых единицах переводятся
+    в базовую единицу и складываются точно, затем выводятся в удобной
+    единице. Возвращает список (название, количество, единица).
+    """
+    totals = defaultdict(Fraction)
+    units = defaultdict(set)
+    for name, unit, amount in rows:
+        dimension, factor = normalize_unit(unit)
+        totals[(name, dimension)] += amount * factor
+        units[(name, dimension)].add(unit)
+    result = []
+    for (name, dimension), total in sorted(totals.items()):
+        unit, amount = choose_unit(dimension, total, units[(name, dimension)])
+        result.append((name, format_amount(amount), unit))
+    return result
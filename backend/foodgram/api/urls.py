@@ -1,9 +1,12 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from . import async_views, metrics
 from .views import (FavoriteViewSet, IngredientViewSet,
                     ListSubscriptionViewSet, RecipeViewSet,
-                    ShoppingCartViewSet, SubscribeViewSet, TagViewSet)
+                    ShoppingCartViewSet, SubscribeViewSet, TagViewSet,
+                    UserExportView)
 
 router = DefaultRouter()
 
@@ -33,8 +36,35 @@ router.register(
 
 app_name = 'api'
 
-urlpatterns = [
+async_urlpatterns = [
+    path('tags/', async_views.tag_list, name='tag-list'),
+    path(
+        'ingredients/',
+        async_views.ingredient_list,
+        name='ingredient-list'
+    ),
+    path('recipes/', async_views.recipe_list, name='recipes-list'),
+    path(
+        'recipes/<int:pk>/',
+        async_views.recipe_detail,
+        name='recipes-detail'
+    ),
+]
+
+urlpatterns = []
+
+if settings.ASYNC_VIEWS:
+    urlpatterns += async_urlpatterns
+
+urlpatterns += [
+    path('metrics/', metrics.metrics, name='metrics'),
     path('auth/', include('djoser.urls.authtoken')),
+    path('users/me/export/', UserExportView.as_view(), name='user-export'),
+    path(
+        'users/<int:user_id>/export/',
+        UserExportView.as_view(),
+        name='user-export-detail'
+    ),
     path('', include(router.urls)),
     path('', include('djoser.urls')),
 ]
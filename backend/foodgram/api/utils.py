@@ -1,25 +1,26 @@
 from io import BytesIO
 
-from django.http import FileResponse
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
 from foodgram.settings import BASE_DIR
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen import canvas
+from rest_framework import serializers, status
+from rest_framework.response import Response
 
 from .serializers import IngredientRecipe
+from .units import consolidate
 
 
 def download_cart(request):
     ingredients = IngredientRecipe.objects.filter(
         recipe__shoppingcarts__user=request.user).values_list(
-        'ingredient__name', 'ingredient__measurement_unit',
-        'amount')
-    cart_list = {}
-    for name, unit, amount in ingredients:
-        if name not in cart_list:
-            cart_list[name] = {"amount": amount, "unit": unit}
-        else:
-            cart_list[name]["amount"] += amount
+        'ingredient__name', 'ingredient__measurement_unit').annotate(
+        total=Sum('amount')).order_by()
+    cart_list = consolidate(ingredients)
     height = 700
     buffer = BytesIO()
     pdfmetrics.registerFont(
@@ -28,10 +29,12 @@ def download_cart(request):
     page = canvas.Canvas(buffer)
     page.setFont('arial', 14)
     page.drawString(100, 750, "Список покупок")
-    for i, (name, data) in enumerate(cart_list.items(), start=1):
-        page.drawString(
-            80, height, f"{i}. {name} – {data['amount']} {data['unit']}"
-        )
+    for i, (name, amount, unit) in enumerate(cart_list, start=1):
+        if height < 50:
+            page.showPage()
+            page.setFont('arial', 14)
+            height = 750
+        page.drawString(80, height, f"{i}. {name} – {amount} {unit}")
         height -= 25
     page.showPage()
     page.save()
@@ -39,3 +42,29 @@ def download_cart(request):
     return FileResponse(
         buffer, as_attachment=True, filename='shopping_list.pdf'
     )
+
+
+def save_unique(serializer, message, related_model, related_id, **kwargs):
+    """Сохраняет связь одним INSERT, полагаясь на ограничения БД.
+
+    Нарушение уникальности превращается в ошибку валидации, ссылка на
+    несуществующий объект — в 404. Проверка выполняется только при ошибке.
+    """
+    try:
+        with transaction.atomic():
+            serializer.save(**kwargs)
+    except IntegrityError:
+        get_object_or_404(related_model, id=related_id)
+        raise serializers.ValidationError(message)
+
+
+def delete_or_404(queryset):
+    """Удаляет строки через QuerySet.delete(), 404 — если удалять нечего.
+
+    Сигналы pre_delete/post_delete отправляются, зависимые данные (кеш
+    флагов, ленты, похожие рецепты) обновляют их обработчики.
+    """
+    deleted, _ = queryset.delete()
+    if not deleted:
+        raise Http404
+    return Response(status=status.HTTP_204_NO_CONTENT)
@@ -1,65 +1,305 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, Prefetch, Sum
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
+from recipes import index
+from recipes.deletion import bulk_delete
+from recipes.feed import get_feed_queryset
 from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
-from rest_framework import mixins, serializers, status, viewsets
+from recipes.similarity import get_top_k, mark_stale
+from rest_framework import mixins, serializers, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.permissions import (AllowAny, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from users.models import Subscription
 
+from .cache import (INGREDIENTS_VERSION, LIST_VERSION, TAGS_VERSION,
+                    cache_anonymous, detail_key, get_version, list_key)
+from .conditional import ConditionalGetMixin
+from .export import ndjson_stream, zip_stream
+from .fast import tag_rows
 from .filters import IngredientFilter, RecipeFilter
+from .membership import invalidate_memberships
+from .metrics import SerializerTimingMixin, timed
 from .permission import IsAuthorOrAdmin
+from .replica import ReplicaReadMixin
 from .serializers import (FavoriteSerializer, IngredientSerializer,
-                          RecipeCreateSerializer, RecipeListRetrieveSerializer,
+                          RecipeCreateSerializer, RecipeIdsSerializer,
+                          RecipeListRetrieveSerializer, RecipeShowSerializer,
                           ShoppingCartSerializer, ShowSubscriptionsSerializer,
-                          SubscribeSerializer, TagSerializer)
-from .utils import download_cart
+                          SubscribeSerializer, TagSerializer, requested_fields)
+from .throttling import is_deep_page
+from .utils import delete_or_404, download_cart, save_unique
 
 User = get_user_model()
 
+INDEX_PARAMS = {'tags', 'author', 'page', 'limit', 'fields', 'expand'}
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+
+def only_requested(queryset, request):
+    """Загружает из БД только столбцы полей, перечисленных в ?fields=."""
+    fields = requested_fields(request)
+    if fields is None:
+        return queryset
+    columns = fields & {
+        field.name for field in queryset.model._meta.concrete_fields
+    }
+    return queryset.only('id', *columns)
+
+
+class TagViewSet(SerializerTimingMixin, ConditionalGetMixin,
+                 ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
 
+    def get_versions(self):
+        return [get_version(TAGS_VERSION)]
+
+    def list(self, request, *args, **kwargs):
+        if settings.FAST_SERIALIZERS:
+            return Response(tag_rows(self.filter_queryset(self.queryset)))
+        return super().list(request, *args, **kwargs)
+
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(SerializerTimingMixin, ConditionalGetMixin,
+                        ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = (IngredientFilter,)
     search_fields = ('^name',)
     permission_classes = (AllowAny,)
     pagination_class = None
+    throttle_scope = 'ingredients'
 
+    def get_versions(self):
+        return [get_version(INGREDIENTS_VERSION)]
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(SerializerTimingMixin, ConditionalGetMixin,
+                    ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     permission_classes = (IsAuthenticatedOrReadOnly, IsAuthorOrAdmin)
+    conditional_actions = ('list', 'retrieve', 'feed')
+    throttle_scope = None
 
-    def get_serializer_class(self):
+    def get_queryset(self):
+        queryset = super().get_queryset()
         if self.action in ['list', 'retrieve']:
+            return only_requested(queryset, self.request)
+        return queryset
+
+    def get_versions(self):
+        if self.action == 'retrieve':
+            pk = Recipe._meta.pk.to_python(self.kwargs['pk'])
+            return [get_version(pk)]
+        return [get_version(LIST_VERSION)]
+
+    def get_serializer_class(self):
+        if self.action in ['list', 'retrieve', 'feed', 'recommended']:
             return RecipeListRetrieveSerializer
         return RecipeCreateSerializer
 
+    @cache_anonymous(list_key)
+    def list(self, request, *args, **kwargs):
+        if 'ids' in request.query_params:
+            return self.batch_response(request.query_params['ids'])
+        if (
+            index.is_enabled()
+            and set(request.query_params) <= INDEX_PARAMS
+            and {'tags', 'author'} & set(request.query_params)
+        ):
+            return self.indexed_response(request.query_params)
+        return super().list(request, *args, **kwargs)
+
+    @cache_anonymous(detail_key)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def check_throttles(self, request):
+        if (
+            self.action == 'list'
+            and request.user.is_anonymous
+            and is_deep_page(request)
+        ):
+            self.throttle_scope = 'deep_pages'
+        super().check_throttles(request)
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def perform_destroy(self, instance):
+        bulk_delete(Recipe.objects.filter(pk=instance.pk))
+
     @action(
         detail=False,
         methods=['get'],
-        permission_classes=(IsAuthenticated,)
+        permission_classes=(IsAuthenticated,),
+        throttle_scope='shopping_cart'
     )
     def download_shopping_cart(self, request):
         return download_cart(request=request)
 
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=(IsAuthenticated,)
+    )
+    def feed(self, request):
+        return self.paginated_response(get_feed_queryset(request.user))
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=(IsAuthenticated,)
+    )
+    def recommended(self, request):
+        queryset = Recipe.objects.filter(
+            similar_to__recipe__favorites__user=request.user
+        ).exclude(
+            favorites__user=request.user
+        ).annotate(
+            rank=Sum('similar_to__score')
+        ).order_by('-rank', '-id')
+        return self.paginated_response(queryset)
+
+    @action(detail=True, methods=['get'], permission_classes=(AllowAny,))
+    def similar(self, request, pk):
+        recipe = self.get_object()
+        queryset = Recipe.objects.filter(
+            similar_to__recipe=recipe
+        ).order_by('-similar_to__score')[:get_top_k()]
+        serializer = timed(RecipeShowSerializer(queryset, many=True))
+        return Response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=(IsAuthenticated,),
+        url_path='shopping_cart'
+    )
+    @transaction.atomic
+    def bulk_shopping_cart(self, request):
+        self.change_recipe_set(request, ShoppingCart)
+        invalidate_memberships(request.user.id)
+        return self.recipe_set_response(request.user, 'shoppingcarts')
+
+    @action(
+        detail=False,
+        methods=['delete'],
+        permission_classes=(IsAuthenticated,),
+        url_path='shopping_cart/clear'
+    )
+    @transaction.atomic
+    def clear_shopping_cart(self, request):
+        ShoppingCart.objects.filter(user=request.user).delete()
+        return self.recipe_set_response(request.user, 'shoppingcarts')
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=(IsAuthenticated,),
+        url_path='favorite'
+    )
+    @transaction.atomic
+    def bulk_favorite(self, request):
+        mark_stale(self.change_recipe_set(request, Favorite))
+        invalidate_memberships(request.user.id)
+        return self.recipe_set_response(request.user, 'favorites')
+
+    def change_recipe_set(self, request, model):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        if request.method == 'POST':
+            model.objects.bulk_create(
+                [model(user=request.user, recipe_id=recipe_id)
+                 for recipe_id in recipe_ids],
+                ignore_conflicts=True
+            )
+        else:
+            model.objects.filter(
+                user=request.user, recipe_id__in=recipe_ids
+            ).delete()
+        return recipe_ids
+
+    def recipe_set_response(self, user, related_name):
+        recipes = Recipe.objects.filter(**{f'{related_name}__user': user})
+        serializer = timed(RecipeShowSerializer(recipes, many=True))
+        return Response(serializer.data)
+
+    def batch_response(self, value):
+        """Рецепты из ?ids=1,2,3 в порядке перечисления, без пагинации."""
+        try:
+            ids = [int(item) for item in value.split(',') if item.strip()]
+        except ValueError:
+            raise serializers.ValidationError(
+                {'ids': 'Укажите id рецептов через запятую.'}
+            )
+        ids = list(dict.fromkeys(ids))
+        if len(ids) > settings.BULK_RECIPES_LIMIT:
+            raise serializers.ValidationError({
+                'ids': 'Не больше {} рецептов за запрос.'.format(
+                    settings.BULK_RECIPES_LIMIT
+                )
+            })
+        recipes = {
+            recipe.id: recipe
+            for recipe in self.filter_queryset(
+                self.get_queryset()
+            ).filter(id__in=ids)
+        }
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for recipe_id in ids if recipe_id in recipes],
+            many=True
+        )
+        return Response(serializer.data)
+
+    def indexed_response(self, params):
+        """Рецепты по тегам и автору из индекса id от новых к старым.
+
+        Пока индекс не построен, а также для неизвестных тегов и авторов
+        (чтобы вернуть ошибку фильтра) список читается через SQL.
+        """
+        slugs = set(params.getlist('tags'))
+        author = params.get('author')
+        tag_ids = list(
+            Tag.objects.filter(slug__in=slugs).values_list('id', flat=True)
+        )
+        ids = None
+        if len(tag_ids) == len(slugs) and (author or '0').isdigit():
+            ids = index.lookup(tag_ids, int(author) if author else None)
+        if ids is None:
+            return self.page_response(
+                self.filter_queryset(self.get_queryset()).order_by('-id')
+            )
+        return self.page_response(
+            index.IndexedRecipes(self.get_queryset(), ids)
+        )
+
+    def paginated_response(self, queryset):
+        return self.page_response(only_requested(queryset, self.request))
+
+    def page_response(self, recipes):
+        page = self.paginate_queryset(recipes)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(recipes, many=True)
+        return Response(serializer.data)
 
-class ShoppingCartViewSet(mixins.CreateModelMixin,
+
+class ShoppingCartViewSet(SerializerTimingMixin,
+                          mixins.CreateModelMixin,
                           mixins.DestroyModelMixin,
                           viewsets.GenericViewSet):
     queryset = ShoppingCart.objects.all()
@@ -67,24 +307,23 @@ class ShoppingCartViewSet(mixins.CreateModelMixin,
     permission_classes = (IsAuthenticated,)
 
     def perform_create(self, serializer):
-        recipe = get_object_or_404(Recipe, id=self.kwargs['recipe_id'])
-        if ShoppingCart.objects.filter(
-            user=self.request.user, recipe=recipe
-        ).exists():
-            raise serializers.ValidationError(
-                'Рецепт уже есть в списке покупок.'
-            )
-        serializer.save(user=self.request.user, recipe=recipe)
+        save_unique(
+            serializer,
+            'Рецепт уже есть в списке покупок.',
+            Recipe,
+            self.kwargs['recipe_id'],
+            user=self.request.user,
+            recipe_id=self.kwargs['recipe_id']
+        )
 
     def delete(self, request, recipe_id):
-        recipe = get_object_or_404(Recipe, id=recipe_id)
-        shoppingcart = get_object_or_404(
-            ShoppingCart, user=request.user, recipe=recipe)
-        shoppingcart.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return delete_or_404(
+            ShoppingCart.objects.filter(user=request.user, recipe_id=recipe_id)
+        )
 
 
-class FavoriteViewSet(mixins.CreateModelMixin,
+class FavoriteViewSet(SerializerTimingMixin,
+                      mixins.CreateModelMixin,
                       mixins.DestroyModelMixin,
                       viewsets.GenericViewSet):
     queryset = Favorite.objects.all()
@@ -92,33 +331,47 @@ class FavoriteViewSet(mixins.CreateModelMixin,
     permission_classes = (IsAuthenticated,)
 
     def perform_create(self, serializer):
-        recipe = get_object_or_404(Recipe, id=self.kwargs['recipe_id'])
-        if Favorite.objects.filter(
-            user=self.request.user, recipe=recipe
-        ).exists():
-            raise serializers.ValidationError(
-                'Рецепт уже есть в избранных.'
-            )
-        serializer.save(user=self.request.user, recipe=recipe)
+        save_unique(
+            serializer,
+            'Рецепт уже есть в избранных.',
+            Recipe,
+            self.kwargs['recipe_id'],
+            user=self.request.user,
+            recipe_id=self.kwargs['recipe_id']
+        )
 
     def delete(self, request, recipe_id):
-        recipe = get_object_or_404(Recipe, id=recipe_id)
-        favorite = get_object_or_404(
-            Favorite, user=request.user, recipe=recipe)
-        favorite.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return delete_or_404(
+            Favorite.objects.filter(user=request.user, recipe_id=recipe_id)
+        )
 
 
-class ListSubscriptionViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+class ListSubscriptionViewSet(SerializerTimingMixin,
+                              ReplicaReadMixin,
+                              mixins.ListModelMixin,
+                              viewsets.GenericViewSet):
     serializer_class = ShowSubscriptionsSerializer
     permission_classes = (IsAuthenticated,)
 
     def get_queryset(self):
         user = self.request.user
-        return User.objects.filter(subscriptions__user=user)
+        queryset = User.objects.filter(subscriptions__user=user)
+        fields = requested_fields(self.request)
+        if fields is None or 'recipes_count' in fields:
+            queryset = queryset.annotate(recipes_count=Count('recipes'))
+        if fields is None or 'recipes' in fields:
+            expand = requested_fields(self.request, 'expand') or set()
+            columns = ('id', 'author')
+            if fields is None or 'recipes' in expand:
+                columns += ('name', 'image', 'cooking_time')
+            queryset = queryset.prefetch_related(
+                Prefetch('recipes', Recipe.objects.only(*columns))
+            )
+        return only_requested(queryset, self.request)
 
 
-class SubscribeViewSet(mixins.CreateModelMixin,
+class SubscribeViewSet(SerializerTimingMixin,
+                       mixins.CreateModelMixin,
                        mixins.DestroyModelMixin,
                        viewsets.GenericViewSet):
     queryset = Subscription.objects.all()
@@ -126,23 +379,51 @@ class SubscribeViewSet(mixins.CreateModelMixin,
     permission_classes = (IsAuthenticated,)
 
     def perform_create(self, serializer):
-        author = get_object_or_404(User, id=self.kwargs['user_id'])
-        user = self.request.user
-        if Subscription.objects.filter(
-            user=user, author=author
-        ).exists():
-            raise serializers.ValidationError(
-                'Подписка на пользователя уже есть.'
-            )
-        if user == author:
+        if self.request.user.id == int(self.kwargs['user_id']):
             raise serializers.ValidationError(
                 'Нельзя подписаться на самого себя.'
             )
-        serializer.save(user=self.request.user, author=author)
+        save_unique(
+            serializer,
+            'Подписка на пользователя уже есть.',
+            User,
+            self.kwargs['user_id'],
+            user=self.request.user,
+            author_id=self.kwargs['user_id']
+        )
 
     def delete(self, request, user_id):
-        author = get_object_or_404(User, id=user_id)
-        subscription = get_object_or_404(
-            Subscription, user=request.user, author=author)
-        subscription.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return delete_or_404(
+            Subscription.objects.filter(user=request.user, author_id=user_id)
+        )
+
+
+class UserExportView(APIView):
+    """Выгрузка рецептов, избранного, покупок и подписок пользователя.
+
+    Свои данные может выгрузить любой пользователь, чужие — только
+    администратор. С параметром archive=zip отдаётся архив с картинками.
+    """
+
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, user_id=None):
+        user = request.user
+        if user_id is not None:
+            if not user.is_staff:
+                raise PermissionDenied
+            user = get_object_or_404(User, id=user_id)
+        if request.query_params.get('archive') == 'zip':
+            response = StreamingHttpResponse(
+                zip_stream(user), content_type='application/zip'
+            )
+            extension = 'zip'
+        else:
+            response = StreamingHttpResponse(
+                ndjson_stream(user), content_type='application/x-ndjson'
+            )
+            extension = 'ndjson'
+        response['Content-Disposition'] = (
+            f'attachment; filename="foodgram-{user.id}.{extension}"'
+        )
+        return response
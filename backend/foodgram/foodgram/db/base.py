@@ -0,0 +1,169 @@
+"""PostgreSQL backend с проверкой соединений и пулом на процесс.
+
+Подключается через DB_ENGINE=foodgram.db. Настройки в DATABASES:
+HEALTH_CHECKS — проверять постоянное соединение перед первым запросом
+в каждом HTTP-запросе; POOL_SIZE — максимум соединений на процесс
+(0 отключает пул); POOL_TIMEOUT — сколько секунд ждать свободного
+соединения. С пулом соединение возвращается в него в конце каждого
+HTTP-запроса, а не по CONN_MAX_AGE: иначе простаивающие потоки держали
+бы слоты пула, и остальные ждали бы POOL_TIMEOUT.
+"""
+import logging
+import threading
+import time
+from functools import partial
+
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+logger = logging.getLogger(__name__)
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """Пул соединений с ограничением размера и статистикой ожидания."""
+
+    def __init__(self, size, timeout, health_checks=False):
+        self.timeout = timeout
+        self.health_checks = health_checks
+        self.idle = []
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(size)
+        self.size = size
+        self.in_use = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def acquire(self, connect):
+        start = time.monotonic()
+        if not self.slots.acquire(timeout=self.timeout):
+            with self.lock:
+                self.timeouts += 1
+            raise base.Database.OperationalError(
+                f'Connection pool exhausted after {self.timeout} s'
+            )
+        waited = time.monotonic() - start
+        with self.lock:
+            self.in_use += 1
+            self.acquired += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            connection = self.idle.pop() if self.idle else None
+        if waited > self.timeout / 2:
+            logger.warning('Waited %.3f s for a database connection', waited)
+        try:
+            if connection is not None and not self.is_usable(connection):
+                connection.close()
+                connection = None
+            return connection or connect()
+        except Exception:
+            self.put_back(None)
+            raise
+
+    def is_usable(self, connection):
+        if connection.closed:
+            return False
+        if not self.health_checks:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except base.Database.Error:
+            return False
+        return True
+
+    def release(self, connection):
+        try:
+            if (
+                not connection.closed
+                and connection.get_transaction_status()
+                != extensions.TRANSACTION_STATUS_IDLE
+            ):
+                connection.rollback()
+        except base.Database.Error:
+            connection.close()
+        self.put_back(None if connection.closed else connection)
+
+    def put_back(self, connection):
+        with self.lock:
+            self.in_use -= 1
+            if connection is not None:
+                self.idle.append(connection)
+        self.slots.release()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': self.size,
+                'in_use': self.in_use,
+                'idle': len(self.idle),
+                'acquired': self.acquired,
+                'timeouts': self.timeouts,
+                'wait_total': self.wait_total,
+                'wait_max': self.wait_max,
+            }
+
+
+def get_pool_stats():
+    """Статистика пулов текущего процесса по алиасам БД."""
+    with pools_lock:
+        return {alias: pool.stats() for alias, pool in pools.items()}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_pending = False
+
+    @property
+    def pool(self):
+        size = self.settings_dict.get('POOL_SIZE')
+        if not size:
+            return None
+        with pools_lock:
+            if self.alias not in pools:
+                pools[self.alias] = ConnectionPool(
+                    size,
+                    self.settings_dict.get('POOL_TIMEOUT', 10),
+                    self.settings_dict.get('HEALTH_CHECKS', False)
+                )
+            return pools[self.alias]
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        connect = partial(super().get_new_connection, conn_params)
+        if pool is None:
+            return connect()
+        return pool.acquire(connect)
+
+    def _close(self):
+        pool = self.pool
+        if pool is None or self.connection is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            return pool.release(self.connection)
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        if self.connection is None:
+            return
+        if self.pool is not None and not self.in_atomic_block:
+            self.close()
+        elif self.settings_dict.get('HEALTH_CHECKS'):
+            self.health_check_pending = True
+
+    def ensure_connection(self):
+        if (
+            self.health_check_pending
+            and self.connection is not None
+            and not self.in_atomic_block
+        ):
+            self.health_check_pending = False
+            if not self.is_usable():
+                self.close()
+        super().ensure_connection()
@@ -0,0 +1,29 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+ESTIMATE_THRESHOLD = 10000
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор админки, берущий число строк из статистики PostgreSQL.
+
+    Оценка используется только для списка без фильтров и только если
+    в таблице больше ESTIMATE_THRESHOLD строк, иначе выполняется
+    обычный COUNT(*).
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE relname = %s',
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] > ESTIMATE_THRESHOLD:
+                return int(row[0])
+        return super().count
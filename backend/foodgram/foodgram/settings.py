@@ -55,10 +55,15 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.metrics.PerformanceMiddleware',
+    'api.profiling.ProfilingMiddleware',
+    'api.compression.CompressionMiddleware',
+    'api.shedding.LoadSheddingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.replica.ReplicaPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -83,21 +88,64 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
+ASYNC_VIEWS = os.getenv('SERVER_MODE', 'wsgi').lower() == 'asgi'
+
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
 DATABASES = {
     'default': {
-        'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.postgresql'),
+        'ENGINE': os.getenv('DB_ENGINE', 'foodgram.db'),
         'NAME': os.getenv('DB_NAME', 'postgres'),
         'USER': os.getenv('POSTGRES_USER', 'postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'postgres'),
         'HOST': os.getenv('DB_HOST', 'db'),
-        'PORT': os.getenv('DB_PORT', '5432')
+        'PORT': os.getenv('DB_PORT', '5432'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        # Used by the foodgram.db engine only.
+        'HEALTH_CHECKS': (
+            os.getenv('DB_HEALTH_CHECKS', 'True').lower() == 'true'
+        ),
+        'POOL_SIZE': int(os.getenv('DB_POOL_SIZE', 10)),
+        'POOL_TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+        # SQLite runs concurrency tests only with a file database.
+        'TEST': {'NAME': os.getenv('DB_TEST_NAME')},
+    }
+}
+
+if os.getenv('DB_REPLICA_HOST') or os.getenv('DB_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.getenv('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'HOST': os.getenv('DB_REPLICA_HOST', DATABASES['default']['HOST']),
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['api.replica.ReplicaRouter']
+
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+
+
+# Cache
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
     }
 }
 
+# LocMemCache and DummyCache live inside one process: anything that must
+# be invalidated across workers (e.g. auth tokens) is not stored there.
+SHARED_CACHE = CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
 
 # Custom User model
 
@@ -165,9 +213,94 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.CustomPagination',
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.TokenBucketThrottle',
+        'api.throttling.IPTokenBucketThrottle',
+    ],
+    # Token buckets live in the default cache: with LocMemCache every
+    # worker has its own, so the effective rate is workers x configured.
+    'DEFAULT_THROTTLE_RATES': {
+        'shopping_cart': os.getenv('THROTTLE_SHOPPING_CART', '10/min'),
+        'shopping_cart_ip': os.getenv('THROTTLE_SHOPPING_CART_IP', '30/min'),
+        'ingredients': os.getenv('THROTTLE_INGREDIENTS', '120/min'),
+        'ingredients_ip': os.getenv('THROTTLE_INGREDIENTS_IP', '600/min'),
+        'deep_pages': os.getenv('THROTTLE_DEEP_PAGES', '30/min'),
+        'deep_pages_ip': os.getenv('THROTTLE_DEEP_PAGES_IP', '30/min'),
+    },
+}
+
+DEEP_PAGE_THRESHOLD = int(os.getenv('DEEP_PAGE_THRESHOLD', 20))
+
+SHED_ROUTES = [
+    'api:recipes-download-shopping-cart',
+    'api:ingredient-list',
+]
+SHED_MAX_IN_FLIGHT = int(os.getenv('SHED_MAX_IN_FLIGHT', 32))
+SHED_MAX_POOL_WAIT_MS = int(os.getenv('SHED_MAX_POOL_WAIT_MS', 200))
+# Needs nginx to send X-Request-Start: t=${msec}.
+SHED_MAX_QUEUE_MS = int(os.getenv('SHED_MAX_QUEUE_MS', 500))
+SHED_WINDOW = int(os.getenv('SHED_WINDOW', 5))
+SHED_RETRY_AFTER = int(os.getenv('SHED_RETRY_AFTER', 5))
+
+BULK_RECIPES_LIMIT = int(os.getenv('BULK_RECIPES_LIMIT', 100))
+
+BULK_DELETE_BATCH_SIZE = int(os.getenv('BULK_DELETE_BATCH_SIZE', 1000))
+BULK_DELETE_IN_BACKGROUND = (
+    os.getenv('BULK_DELETE_IN_BACKGROUND', 'False').lower() == 'true'
+)
+
+# Used only with SHARED_CACHE; otherwise tokens are cached per process
+# for AUTH_TOKEN_LOCAL_CACHE_TTL seconds.
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', 300))
+AUTH_TOKEN_LOCAL_CACHE_TTL = int(os.getenv('AUTH_TOKEN_LOCAL_CACHE_TTL', 5))
+AUTH_TOKEN_LOCAL_CACHE_SIZE = int(
+    os.getenv('AUTH_TOKEN_LOCAL_CACHE_SIZE', 1024)
+)
+
+MEMBERSHIP_CACHE_TTL = int(os.getenv('MEMBERSHIP_CACHE_TTL', 0))
+
+ANON_CACHE_TTL = int(os.getenv('ANON_CACHE_TTL', 60))
+ANON_CACHE_STALE = int(os.getenv('ANON_CACHE_STALE', 30))
+
+RECIPE_FRAGMENT_CACHE_TTL = int(os.getenv('RECIPE_FRAGMENT_CACHE_TTL', 3600))
+
+RECIPE_INDEX_TTL = int(os.getenv('RECIPE_INDEX_TTL', 3600))
+
+FAST_SERIALIZERS = os.getenv('FAST_SERIALIZERS', 'False').lower() == 'true'
+
+
+# Performance metrics
+
+PERF_SLOW_REQUEST_MS = int(os.getenv('PERF_SLOW_REQUEST_MS', 500))
+PERF_SLOW_REQUEST_QUERIES = int(os.getenv('PERF_SLOW_REQUEST_QUERIES', 50))
+PERF_N_PLUS_ONE_THRESHOLD = int(os.getenv('PERF_N_PLUS_ONE_THRESHOLD', 10))
+PERF_METRICS_TOKEN = os.getenv('PERF_METRICS_TOKEN', '')
+
+PROFILING_DIR = os.getenv('PROFILING_DIR', os.path.join(BASE_DIR, 'profiles'))
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))
+PROFILING_TOKEN_MAX_AGE = int(os.getenv('PROFILING_TOKEN_MAX_AGE', 3600))
+PROFILING_MAX_FILES = int(os.getenv('PROFILING_MAX_FILES', 100))
+PROFILING_MAX_BYTES = int(os.getenv('PROFILING_MAX_BYTES', 50 * 1024 * 1024))
+
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', 5))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'foodgram': {'handlers': ['console'], 'level': 'INFO'},
+    },
 }
 
 
@@ -187,3 +320,13 @@ DJOSER = {
     },
     'HIDE_USERS': False,
 }
+
+
+# Feed settings
+
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 1000))
+
+
+# Recommendations settings
+
+SIMILAR_RECIPES_TOP_K = int(os.getenv('SIMILAR_RECIPES_TOP_K', 10))
@@ -13,10 +13,21 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from api import profiling
 from django.contrib import admin
 from django.urls import include, path
 
 urlpatterns = [
+    path(
+        'admin/profiles/',
+        admin.site.admin_view(profiling.capture_list),
+        name='profiles',
+    ),
+    path(
+        'admin/profiles/<str:name>/',
+        admin.site.admin_view(profiling.capture_download),
+        name='profile-download',
+    ),
     path('admin/', admin.site.urls),
     path('api/', include('api.urls', namespace='api')),
 ]
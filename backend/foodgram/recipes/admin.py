@@ -1,5 +1,12 @@
+from django import forms
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from foodgram.paginator import EstimatedCountPaginator
 
+from .deletion import bulk_delete, delete_in_background
 from .models import Favorite, Ingredient, IngredientRecipe, Recipe, Tag
 
 # class TagInLine(admin.TabularInline):
@@ -7,21 +14,119 @@ from .models import Favorite, Ingredient, IngredientRecipe, Recipe, Tag
 #     extra = 3
 
 
+class AuthorFilter(admin.SimpleListFilter):
+    """Фильтр по автору с поиском вместо списка всех авторов."""
+
+    title = 'автор'
+    parameter_name = 'author'
+    template = 'admin/autocomplete_filter.html'
+
+    def __init__(self, request, params, model, model_admin):
+        super().__init__(request, params, model, model_admin)
+        field = model._meta.get_field('author')
+        self.form_field = forms.ModelChoiceField(
+            queryset=field.related_model.objects.all(),
+            widget=AutocompleteSelect(field, model_admin.admin_site),
+            required=False,
+        )
+        self.hidden_params = [
+            (key, value) for key, value in request.GET.items()
+            if key not in (self.parameter_name, 'p')
+        ]
+
+    def has_output(self):
+        return True
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def widget(self):
+        return self.form_field.widget.render(
+            self.parameter_name, self.value(),
+            attrs={
+                'id': 'id_filter_' + self.parameter_name,
+                'onchange': 'this.form.submit()',
+            },
+        )
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(author_id=self.value())
+        return queryset
+
+
+class BulkDeleteMixin:
+    """Удаление из админки через bulk_delete.
+
+    Страница подтверждения показывает только число удаляемых объектов,
+    не собирая все зависимые строки.
+    """
+
+    def get_deleted_objects(self, objs, request):
+        opts = self.model._meta
+        objs = list(objs)
+        perms_needed = set()
+        if not self.has_delete_permission(request):
+            perms_needed.add(opts.verbose_name)
+        return (
+            [str(obj) for obj in objs],
+            {opts.verbose_name_plural: len(objs)},
+            perms_needed,
+            [],
+        )
+
+    def delete_queryset(self, request, queryset):
+        queryset = self.model._base_manager.filter(
+            pk__in=list(queryset.values_list('pk', flat=True))
+        )
+        if settings.BULK_DELETE_IN_BACKGROUND:
+            delete_in_background(queryset)
+        else:
+            bulk_delete(queryset)
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(
+            request, self.model._base_manager.filter(pk=obj.pk)
+        )
+
+
 class IngredientInLine(admin.TabularInline):
     model = IngredientRecipe
     extra = 3
+    autocomplete_fields = ('ingredient',)
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(BulkDeleteMixin, admin.ModelAdmin):
     list_display = ['name', 'author', 'favorites']
-    list_filter = ['name', 'author', 'tags']
+    list_filter = [AuthorFilter, 'tags']
+    list_select_related = ['author']
+    search_fields = ['^name']
+    autocomplete_fields = ['author']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     inlines = (IngredientInLine,)
 
+    @property
+    def media(self):
+        author = AutocompleteSelect(
+            Recipe._meta.get_field('author'), self.admin_site
+        )
+        return super().media + author.media
+
+    def get_queryset(self, request):
+        favorites = Favorite.objects.filter(
+            recipe=OuterRef('pk')
+        ).values('recipe').annotate(count=Count('pk')).values('count')
+        return super().get_queryset(request).annotate(
+            favorites_count=Coalesce(
+                Subquery(favorites, output_field=IntegerField()), 0
+            )
+        )
+
+    @admin.display(description='В избранном', ordering='favorites_count')
     def favorites(self, obj):
-        if Favorite.objects.filter(recipe=obj).exists():
-            return Favorite.objects.filter(recipe=obj).count()
-        return 0
+        return obj.favorites_count
 
 
 @admin.register(Tag)
@@ -33,4 +138,7 @@ class TagAdmin(admin.ModelAdmin):
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ['name', 'measurement_unit']
     list_editable = ['measurement_unit']
-    list_filter = ['name']
+    ordering = ['id']
+    search_fields = ['^name']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -0,0 +1,111 @@
+"""Пакетное удаление пользователей и рецептов.
+
+QuerySet.delete() собирает в память все зависимые объекты и шлёт
+сигналы по каждому из них. bulk_delete удаляет те же строки
+SQL-запросами пачками: сначала зависимые таблицы, затем саму модель.
+Сигналы pre_delete/post_delete не отправляются, вместо них для каждой
+пачки моделей с зависимостями или подписчиками отправляется
+pre_bulk_delete со списком первичных ключей.
+"""
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.db.models import CASCADE, DO_NOTHING, SET_NULL, Subquery
+from django.db.models.deletion import get_candidate_relations_to_delete
+from django.dispatch import Signal
+
+from .models import Recipe
+
+logger = logging.getLogger('foodgram.deletion')
+
+pre_bulk_delete = Signal()
+
+executor = ThreadPoolExecutor(max_workers=1)
+
+
+def get_batch_size():
+    return getattr(settings, 'BULK_DELETE_BATCH_SIZE', 1000)
+
+
+def delete_related(relation, pks, batch_size, counter):
+    field = relation.field
+    queryset = relation.related_model._base_manager.filter(
+        **{f'{field.name}__in': pks}
+    )
+    on_delete = field.remote_field.on_delete
+    if on_delete is CASCADE:
+        bulk_delete(queryset, batch_size, counter)
+    elif on_delete is SET_NULL:
+        queryset.update(**{field.name: None})
+    elif on_delete is not DO_NOTHING:
+        raise ValueError(
+            f'Пакетное удаление не поддерживает {on_delete.__name__} '
+            f'для {relation.related_model._meta.label}.{field.name}'
+        )
+
+
+def bulk_delete(queryset, batch_size=None, counter=None):
+    """Удаляет строки queryset и всё, что на них ссылается.
+
+    Возвращает Counter с числом удалённых строк по моделям. Каждая пачка
+    удаляется в своей транзакции, поэтому прерванное удаление оставляет
+    согласованные данные и его можно повторить.
+    """
+    model = queryset.model
+    batch_size = batch_size or get_batch_size()
+    counter = Counter() if counter is None else counter
+    relations = list(get_candidate_relations_to_delete(model._meta))
+    manager = model._base_manager.db_manager(queryset.db)
+    queryset = queryset.order_by('pk')
+    if not relations and not pre_bulk_delete.has_listeners(model):
+        while True:
+            deleted = manager.filter(
+                pk__in=Subquery(queryset.values('pk')[:batch_size])
+            )._raw_delete(queryset.db)
+            counter[model._meta.label] += deleted
+            if deleted < batch_size:
+                return counter
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return counter
+        with transaction.atomic(using=queryset.db):
+            pre_bulk_delete.send(sender=model, pks=pks)
+            for relation in relations:
+                delete_related(relation, pks, batch_size, counter)
+            counter[model._meta.label] += manager.filter(
+                pk__in=pks
+            )._raw_delete(queryset.db)
+        if len(pks) < batch_size:
+            return counter
+
+
+def delete_in_background(queryset, batch_size=None):
+    """Запускает bulk_delete в фоновом потоке после коммита транзакции."""
+    def run():
+        try:
+            counter = bulk_delete(queryset, batch_size)
+            logger.info('Удалено: %s', dict(counter))
+        except Exception:
+            logger.exception('Ошибка фонового удаления')
+        finally:
+            connections.close_all()
+
+    transaction.on_commit(lambda: executor.submit(run))
+
+
+def delete_orphaned_images(names):
+    """Удаляет файлы картинок, которые не использует ни один рецепт."""
+    names = set(names) - {''}
+    used = set(Recipe.objects.filter(
+        image__in=names
+    ).values_list('image', flat=True))
+    for name in names - used:
+        try:
+            default_storage.delete(name)
+        except OSError:
+            logger.warning('Не удалось удалить файл %s', name)
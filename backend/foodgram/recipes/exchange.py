@@ -0,0 +1,266 @@
+"""Выгрузка и загрузка рецептов в формате NDJSON.
+
+Каждая строка — рецепт с автором (email), тегами (slug), ингредиентами
+(название, единица измерения, количество) и путём к картинке
+относительно MEDIA_ROOT.
+"""
+import json
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Prefetch
+
+from . import index
+from .feed import fanout_recipes
+from .models import Ingredient, IngredientRecipe, Recipe, Tag
+from .nutrition import INGREDIENT_FIELDS, NUTRITION_FIELDS, TOTAL_FIELDS
+
+User = get_user_model()
+
+
+def iter_chunks(queryset, chunk_size):
+    """Проходит queryset пачками по возрастанию id.
+
+    В отличие от iterator() сохраняет prefetch_related, а память
+    ограничена одной пачкой.
+    """
+    last_id = 0
+    while True:
+        chunk = list(
+            queryset.filter(id__gt=last_id).order_by('id')[:chunk_size]
+        )
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1].id
+
+
+def export_queryset():
+    return Recipe.objects.select_related('author').prefetch_related(
+        'tags',
+        Prefetch(
+            'ingredientrecipes',
+            IngredientRecipe.objects.select_related(
+                'ingredient'
+            ).order_by('id')
+        ),
+    )
+
+
+def recipe_to_dict(recipe):
+    return {
+        'name': recipe.name,
+        'author': recipe.author.email,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'image': recipe.image.name,
+        'tags': [tag.slug for tag in recipe.tags.all()],
+        'ingredients': [
+            {
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in recipe.ingredientrecipes.all()
+        ],
+    }
+
+
+def export_lines(queryset, chunk_size=1000):
+    for chunk in iter_chunks(queryset, chunk_size):
+        for recipe in chunk:
+            yield json.dumps(recipe_to_dict(recipe), ensure_ascii=False)
+
+
+class RecipeImporter:
+    """Загрузка рецептов пачками через bulk_create.
+
+    Теги и ингредиенты загружаются в словари один раз, авторы — по мере
+    появления новых email. КБЖУ и стоимость считаются при разборе строки,
+    поэтому отдельный пересчёт после вставки не нужен. Если пачка не
+    записалась в БД, её строки попадают в errors, остальные пачки
+    загружаются.
+    """
+
+    def __init__(self, chunk_size=1000, default_author=None):
+        self.chunk_size = chunk_size
+        self.default_author = default_author
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.ingredients = {
+            (row['name'], row['measurement_unit']): row
+            for row in Ingredient.objects.values(
+                'id', 'name', 'measurement_unit', *INGREDIENT_FIELDS
+            )
+        }
+        self.authors = {}
+        self.created = 0
+        self.errors = []
+
+    def load_authors(self, lines):
+        emails = {
+            line['author'] for line in lines
+            if isinstance(line.get('author'), str)
+        } - set(self.authors)
+        self.authors.update(
+            User.objects.filter(email__in=emails).values_list('email', 'id')
+        )
+
+    def get_author_id(self, email):
+        author_id = self.authors.get(email)
+        if author_id is None and self.default_author is not None:
+            return self.default_author.id
+        if author_id is None:
+            raise ValueError(f'Неизвестный автор: {email}')
+        return author_id
+
+    def check_length(self, field, value):
+        max_length = Recipe._meta.get_field(field).max_length
+        if len(value) > max_length:
+            raise ValueError(
+                f'Поле {field} длиннее {max_length} символов'
+            )
+        return value
+
+    def build_items(self, line):
+        """Ингредиенты строки и КБЖУ со стоимостью рецепта."""
+        items = []
+        totals = dict.fromkeys(TOTAL_FIELDS)
+        for item in line['ingredients']:
+            key = (item['name'], item['measurement_unit'])
+            ingredient = self.ingredients.get(key)
+            if ingredient is None:
+                raise ValueError(
+                    'Неизвестный ингредиент: {} ({})'.format(*key)
+                )
+            amount = int(item['amount'])
+            if amount < 1:
+                raise ValueError(
+                    'Количество ингредиентов должно быть больше 0'
+                )
+            items.append((ingredient['id'], amount))
+            for field in NUTRITION_FIELDS:
+                if ingredient[field] is not None:
+                    totals[field] = (
+                        (totals[field] or 0) + amount * ingredient[field]
+                    )
+            if ingredient['price'] is not None:
+                totals['cost'] = (
+                    (totals['cost'] or Decimal(0))
+                    + amount * ingredient['price']
+                )
+        if not items:
+            raise ValueError('Нет ингредиентов')
+        return items, totals
+
+    def build(self, line):
+        tag_ids = []
+        for slug in line['tags']:
+            if slug not in self.tags:
+                raise ValueError(f'Неизвестный тег: {slug}')
+            tag_ids.append(self.tags[slug])
+        items, totals = self.build_items(line)
+        cooking_time = int(line['cooking_time'])
+        if cooking_time < 1:
+            raise ValueError('Время приготовления меньше минуты')
+        name = self.check_length('name', line['name'])
+        if not name.strip():
+            raise ValueError('Пустое название')
+        recipe = Recipe(
+            author_id=self.get_author_id(line.get('author')),
+            name=name,
+            text=line['text'],
+            cooking_time=cooking_time,
+            image=self.check_length('image', line.get('image', '')),
+            **totals
+        )
+        return recipe, tag_ids, items
+
+    def read_back_ids(self, recipes):
+        """Проставляет id после bulk_create там, где нет RETURNING.
+
+        SQLite блокирует БД на запись до конца транзакции, поэтому
+        последние строки таблицы — только что вставленные, по порядку.
+        """
+        ids = list(Recipe.objects.order_by('-id').values_list(
+            'id', flat=True
+        )[:len(recipes)])
+        for recipe, pk in zip(recipes, reversed(ids)):
+            recipe.id = pk
+
+    def save(self, batch):
+        recipes = [recipe for recipe, _, _ in batch]
+        with transaction.atomic():
+            Recipe.objects.bulk_create(recipes)
+            if not connection.features.can_return_rows_from_bulk_insert:
+                self.read_back_ids(recipes)
+            Recipe.tags.through.objects.bulk_create([
+                Recipe.tags.through(recipe_id=recipe.id, tag_id=tag_id)
+                for recipe, tag_ids, _ in batch
+                for tag_id in set(tag_ids)
+            ])
+            IngredientRecipe.objects.bulk_create([
+                IngredientRecipe(
+                    recipe_id=recipe.id,
+                    ingredient_id=ingredient_id,
+                    amount=amount,
+                )
+                for recipe, _, items in batch
+                for ingredient_id, amount in items
+            ])
+            fanout_recipes(recipes)
+            index.invalidate(
+                {tag_id for _, tag_ids, _ in batch for tag_id in tag_ids},
+                {recipe.author_id for recipe in recipes},
+            )
+        self.created += len(recipes)
+
+    def run(self, lines):
+        """Загружает строки NDJSON, возвращает число созданных рецептов."""
+        chunk = []
+        for number, text in enumerate(lines, 1):
+            if text.strip():
+                chunk.append((number, text))
+            if len(chunk) >= self.chunk_size:
+                self.save_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.save_chunk(chunk)
+        return self.created
+
+    def parse(self, chunk):
+        parsed = []
+        for number, text in chunk:
+            try:
+                line = json.loads(text)
+            except ValueError as error:
+                self.errors.append((number, str(error)))
+                continue
+            if not isinstance(line, dict):
+                self.errors.append((number, 'Строка не является объектом'))
+                continue
+            parsed.append((number, line))
+        return parsed
+
+    def save_chunk(self, chunk):
+        parsed = self.parse(chunk)
+        self.load_authors([line for _, line in parsed])
+        batch = []
+        numbers = []
+        for number, line in parsed:
+            try:
+                batch.append(self.build(line))
+                numbers.append(number)
+            except KeyError as error:
+                self.errors.append((number, f'Нет поля {error}'))
+            except (TypeError, ValueError) as error:
+                self.errors.append((number, str(error)))
+        if not batch:
+            return
+        try:
+            self.save(batch)
+        except DatabaseError as error:
+            self.errors.extend(
+                (number, f'Ошибка БД в пачке строк: {error}')
+                for number in numbers
+            )
@@ -0,0 +1,121 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Q
+from users.models import Subscription
+
+from .models import FeedItem, PopularAuthor, Recipe
+
+
+def get_fanout_limit():
+    return getattr(settings, 'FEED_FANOUT_LIMIT', 1000)
+
+
+def is_popular(author_id):
+    return PopularAuthor.objects.filter(author_id=author_id).exists()
+
+
+def update_popularity(author_id):
+    """Пересчитывает флаг PopularAuthor после изменения подписок автора.
+
+    Когда автор перестаёт быть популярным, его рецепты, созданные без
+    разноса, добавляются в ленты всех подписчиков.
+    """
+    limit = get_fanout_limit()
+    popular = Subscription.objects.filter(
+        author_id=author_id
+    )[limit:limit + 1].exists()
+    if popular:
+        PopularAuthor.objects.bulk_create(
+            [PopularAuthor(author_id=author_id)], ignore_conflicts=True
+        )
+    elif PopularAuthor.objects.filter(author_id=author_id).delete()[0]:
+        recipe_ids = list(Recipe.objects.filter(
+            author_id=author_id
+        ).values_list('id', flat=True))
+        followers = Subscription.objects.filter(
+            author_id=author_id
+        ).values_list('user_id', flat=True)
+        FeedItem.objects.bulk_create(
+            [FeedItem(user_id=user_id, author_id=author_id,
+                      recipe_id=recipe_id)
+             for user_id in followers.iterator()
+             for recipe_id in recipe_ids],
+            batch_size=1000,
+            ignore_conflicts=True
+        )
+
+
+def fanout_recipe(recipe):
+    """Разносит новый рецепт по лентам подписчиков автора."""
+    if is_popular(recipe.author_id):
+        return
+    followers = Subscription.objects.filter(
+        author_id=recipe.author_id
+    ).values_list('user_id', flat=True)
+    FeedItem.objects.bulk_create(
+        [FeedItem(user_id=user_id, author_id=recipe.author_id,
+                  recipe_id=recipe.id) for user_id in followers],
+        ignore_conflicts=True
+    )
+
+
+def fanout_recipes(recipes):
+    """Разносит по лентам пачку новых рецептов разных авторов."""
+    by_author = defaultdict(list)
+    for recipe in recipes:
+        by_author[recipe.author_id].append(recipe.id)
+    followers = Subscription.objects.filter(
+        author_id__in=by_author
+    ).exclude(
+        author_id__in=PopularAuthor.objects.values('author_id')
+    ).values_list('author_id', 'user_id')
+    FeedItem.objects.bulk_create(
+        [
+            FeedItem(user_id=user_id, author_id=author_id,
+                     recipe_id=recipe_id)
+            for author_id, user_id in followers
+            for recipe_id in by_author[author_id]
+        ],
+        batch_size=1000,
+        ignore_conflicts=True
+    )
+
+
+def backfill_feed(user_id, author_id):
+    """Добавляет в ленту рецепты автора, на которого подписался user."""
+    if is_popular(author_id):
+        return
+    recipe_ids = Recipe.objects.filter(
+        author_id=author_id
+    ).values_list('id', flat=True)
+    FeedItem.objects.bulk_create(
+        [FeedItem(user_id=user_id, author_id=author_id, recipe_id=recipe_id)
+         for recipe_id in recipe_ids],
+        ignore_conflicts=True
+    )
+
+
+def drop_feed(user_id, author_id):
+    FeedItem.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def get_feed_queryset(user):
+    """Лента рецептов авторов, на которых подписан пользователь.
+
+    Рецепты обычных авторов читаются из FeedItem по индексу
+    (user, -recipe). Рецепты популярных авторов (PopularAuthor) не
+    разносятся и подмешиваются при чтении, только если пользователь на
+    них подписан.
+    """
+    popular_authors = list(PopularAuthor.objects.filter(
+        author__subscriptions__user=user
+    ).values_list('author_id', flat=True))
+    if not popular_authors:
+        return Recipe.objects.filter(
+            feeditems__user=user
+        ).order_by('-feeditems__recipe')
+    timeline = FeedItem.objects.filter(user=user).values('recipe_id')
+    return Recipe.objects.filter(
+        Q(id__in=timeline) | Q(author_id__in=popular_authors)
+    ).order_by('-id')
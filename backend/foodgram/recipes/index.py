@@ -0,0 +1,200 @@
+"""Списки id рецептов по тегам и авторам в кеше.
+
+Для каждого тега и автора в кеше лежит отсортированный array('q') с id
+рецептов. Список рецептов с фильтром tags и/или author собирается
+объединением списков тегов и пересечением со списком автора, из БД
+читаются только строки текущей страницы. Ключи версионируются: при
+изменении рецептов версия увеличивается после коммита, и список
+перестраивается при следующем чтении в фоновом потоке. Пока списка нет
+в кеше, запрос обслуживается обычным SQL.
+
+Индекс работает только с общим кешем (SHARED_CACHE): версии из
+LocMemCache увеличил бы только процесс, изменивший рецепты, а остальные
+воркеры и команды вроде import_recipes их не видят.
+"""
+import heapq
+import logging
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+
+from .models import Recipe
+
+logger = logging.getLogger('foodgram.index')
+
+PREFIX = 'recipe-index'
+TAG = 'tag'
+AUTHOR = 'author'
+WARM_LOCK_TIMEOUT = 60
+
+executor = ThreadPoolExecutor(max_workers=1)
+
+
+def is_enabled():
+    return settings.SHARED_CACHE and settings.RECIPE_INDEX_TTL > 0
+
+
+def version_key(kind, pk):
+    return f'{PREFIX}-version:{kind}:{pk}'
+
+
+def get_keys(entries):
+    """Ключи списков для пар (вид, id) с текущими версиями."""
+    versions = cache.get_many([version_key(*entry) for entry in entries])
+    keys = {}
+    for kind, pk in entries:
+        version = versions.get(version_key(kind, pk))
+        if version is None:
+            version = cache.get_or_set(version_key(kind, pk), 1, None)
+        keys[kind, pk] = f'{PREFIX}:{kind}:{pk}:{version}'
+    return keys
+
+
+def bump(entries):
+    for kind, pk in set(entries):
+        try:
+            cache.incr(version_key(kind, pk))
+        except ValueError:
+            cache.set(version_key(kind, pk), 1, None)
+
+
+def invalidate(tag_ids=(), author_ids=()):
+    """Сбрасывает списки тегов и авторов после коммита транзакции."""
+    if not is_enabled():
+        return
+    entries = [(TAG, pk) for pk in tag_ids] + [
+        (AUTHOR, pk) for pk in author_ids
+    ]
+    if entries:
+        transaction.on_commit(lambda: bump(entries))
+
+
+def invalidate_recipe_ids(recipe_ids):
+    """Сбрасывает списки тегов и авторов перечисленных рецептов."""
+    if not is_enabled():
+        return
+    recipe_ids = list(recipe_ids)
+    invalidate(
+        Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('tag_id', flat=True).distinct(),
+        Recipe.objects.filter(
+            id__in=recipe_ids
+        ).values_list('author_id', flat=True).distinct(),
+    )
+
+
+def build(kind, pk):
+    if kind == TAG:
+        ids = Recipe.tags.through.objects.filter(tag_id=pk).order_by(
+            'recipe_id'
+        ).values_list('recipe_id', flat=True)
+    else:
+        ids = Recipe.objects.filter(author_id=pk).order_by(
+            'id'
+        ).values_list('id', flat=True)
+    return array('q', ids)
+
+
+def warm(keys):
+    try:
+        for (kind, pk), key in keys.items():
+            cache.set(key, build(kind, pk), settings.RECIPE_INDEX_TTL)
+            cache.delete(f'{key}:lock')
+    except Exception:
+        logger.exception('Ошибка построения индекса рецептов')
+    finally:
+        connections.close_all()
+
+
+def schedule_warm(keys):
+    keys = {
+        entry: key for entry, key in keys.items()
+        if cache.add(f'{key}:lock', 1, WARM_LOCK_TIMEOUT)
+    }
+    if keys:
+        executor.submit(warm, keys)
+
+
+def union(arrays):
+    """Слияние отсортированных списков id без повторов."""
+    if len(arrays) == 1:
+        return arrays[0]
+    ids = array('q')
+    for pk in heapq.merge(*arrays):
+        if not ids or ids[-1] != pk:
+            ids.append(pk)
+    return ids
+
+
+def intersection(first, second):
+    """Пересечение отсортированных списков: поиск id меньшего в большем."""
+    if len(first) > len(second):
+        first, second = second, first
+    ids = array('q')
+    for pk in first:
+        position = bisect_left(second, pk)
+        if position < len(second) and second[position] == pk:
+            ids.append(pk)
+    return ids
+
+
+def lookup(tag_ids, author_id=None):
+    """Отсортированные id рецептов с любым из тегов и заданным автором.
+
+    Возвращает None, если нужных списков ещё нет в кеше.
+    """
+    entries = [(TAG, pk) for pk in tag_ids]
+    if author_id is not None:
+        entries.append((AUTHOR, author_id))
+    keys = get_keys(entries)
+    found = cache.get_many(list(keys.values()))
+    missing = {
+        entry: key for entry, key in keys.items() if key not in found
+    }
+    if missing:
+        schedule_warm(missing)
+        return None
+    ids = None
+    if tag_ids:
+        ids = union([found[keys[TAG, pk]] for pk in tag_ids])
+    if author_id is not None:
+        author_ids = found[keys[AUTHOR, author_id]]
+        ids = author_ids if ids is None else intersection(ids, author_ids)
+    return ids
+
+
+class IndexedRecipes:
+    """Рецепты по списку id от новых к старым.
+
+    Подходит для Paginator: срез читает из БД только рецепты своей
+    страницы.
+    """
+
+    def __init__(self, queryset, ids):
+        self.queryset = queryset
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def count(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop, step = index.indices(len(self.ids))
+        ids = [
+            self.ids[len(self.ids) - 1 - position]
+            for position in range(start, stop, step)
+        ]
+        recipes = self.queryset.in_bulk(ids)
+        return [recipes[pk] for pk in ids if pk in recipes]
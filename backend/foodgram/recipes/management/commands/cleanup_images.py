@@ -0,0 +1,29 @@
+import os
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Deletes recipe image files that no recipe refers to."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true",
+                            help="only list the files")
+
+    def handle(self, *args, **options):
+        directory = Recipe._meta.get_field('image').upload_to.rstrip('/')
+        if not default_storage.exists(directory):
+            return
+        _, files = default_storage.listdir(directory)
+        used = set(Recipe.objects.values_list('image', flat=True))
+        orphaned = [
+            name for name in (os.path.join(directory, file) for file in files)
+            if name not in used
+        ]
+        for name in orphaned:
+            self.stdout.write(name)
+            if not options["dry_run"]:
+                default_storage.delete(name)
+        self.stderr.write(f"Orphaned files: {len(orphaned)}")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from recipes.similarity import refresh_similar
+
+
+class Command(BaseCommand):
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full", action="store_true",
+            help="recompute all recipes, not only changed ones"
+        )
+        parser.add_argument("--top", type=int, help="neighbours per recipe")
+
+    def handle(self, *args, **options):
+        count = refresh_similar(full=options["full"], top_k=options["top"])
+        self.stdout.write(f"Recomputed {count} recipes")
@@ -0,0 +1,33 @@
+import sys
+
+from django.core.management.base import BaseCommand
+from recipes.exchange import export_lines, export_queryset
+
+
+class Command(BaseCommand):
+    help = "Exports recipes as NDJSON, one recipe per line."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", type=str,
+                            help="output file, stdout if empty")
+        parser.add_argument("--author", type=str,
+                            help="export only recipes of this email")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        queryset = export_queryset()
+        if options["author"]:
+            queryset = queryset.filter(author__email=options["author"])
+        output = (
+            open(options["path"], "w", encoding="utf-8")
+            if options["path"] else sys.stdout
+        )
+        count = 0
+        try:
+            for line in export_lines(queryset, options["chunk_size"]):
+                output.write(line + "\n")
+                count += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        self.stderr.write(f"Exported {count} recipes")
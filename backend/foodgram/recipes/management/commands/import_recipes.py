@@ -0,0 +1,44 @@
+import time
+
+from api.cache import invalidate_recipes
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from recipes.exchange import RecipeImporter
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ("Imports recipes from NDJSON made by export_recipes. Tags and "
+            "ingredients must already exist; broken lines are reported "
+            "and skipped.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", type=str, required=True,
+                            help="file path")
+        parser.add_argument("--author", type=str,
+                            help="email used when the recipe author "
+                                 "is missing or unknown")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        default_author = None
+        if options["author"]:
+            default_author = User.objects.filter(
+                email=options["author"]
+            ).first()
+            if default_author is None:
+                raise CommandError(f"Unknown author {options['author']}")
+        importer = RecipeImporter(options["chunk_size"], default_author)
+        started = time.monotonic()
+        with open(options["path"], encoding="utf-8") as lines:
+            created = importer.run(lines)
+        elapsed = time.monotonic() - started
+        invalidate_recipes([])
+        for number, error in sorted(importer.errors):
+            self.stderr.write(f"line {number}: {error}")
+        self.stdout.write(
+            f"Imported {created} recipes, skipped {len(importer.errors)} "
+            f"in {elapsed:.1f} s ({created * 60 / max(elapsed, 1e-6):.0f} "
+            f"per minute)"
+        )
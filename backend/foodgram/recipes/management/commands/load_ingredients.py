@@ -1,7 +1,14 @@
+import csv
 import json
 
+from api.cache import INGREDIENTS_VERSION, bump_version
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
 from recipes.models import Ingredient
+from recipes.nutrition import INGREDIENT_FIELDS, update_ingredient_recipes
+
+CSV_FIELDS = ('name', 'measurement_unit') + INGREDIENT_FIELDS
 
 
 class Command(BaseCommand):
@@ -9,16 +16,60 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("--path", type=str, help="file path")
 
+    def read_file(self, file_path):
+        with open(file_path, encoding='utf-8') as f:
+            if file_path.endswith('.csv'):
+                return [
+                    {key: value for key, value in zip(CSV_FIELDS, row)
+                     if value != ''}
+                    for row in csv.reader(f)
+                ]
+            return json.load(f)
+
     def handle(self, *args, **options):
-        file_path = options["path"]
+        data = self.read_file(options["path"])
+        existing = {
+            (ingredient.name, ingredient.measurement_unit): ingredient
+            for ingredient in Ingredient.objects.all()
+        }
+        new_ingredients = {}
+        changed = {}
+        for line in data:
+            key = (line['name'], line['measurement_unit'])
+            values = {
+                field: Ingredient._meta.get_field(field).to_python(
+                    line[field]
+                )
+                for field in INGREDIENT_FIELDS
+                if line.get(field) is not None
+            }
+            ingredient = existing.get(key)
+            if ingredient is None:
+                new_ingredients[key] = Ingredient(
+                    name=line['name'],
+                    measurement_unit=line['measurement_unit'],
+                    **values
+                )
+                continue
+            for field, value in values.items():
+                if getattr(ingredient, field) != value:
+                    setattr(ingredient, field, value)
+                    changed[ingredient.id] = ingredient
 
-        with open(file_path, encoding='utf-8') as f:
-            jsondata = json.load(f)
-            for line in jsondata:
-                if not Ingredient.objects.filter(
-                        name=line['name'],
-                        measurement_unit=line['measurement_unit']).exists():
-                    Ingredient.objects.create(
-                        name=line['name'],
-                        measurement_unit=line['measurement_unit']
-                    )
+        with transaction.atomic():
+            Ingredient.objects.bulk_create(
+                new_ingredients.values(), batch_size=1000
+            )
+            if new_ingredients:
+                transaction.on_commit(
+                    lambda: bump_version(INGREDIENTS_VERSION)
+                )
+            now = timezone.now()
+            for ingredient in changed.values():
+                ingredient.updated_at = now
+            Ingredient.objects.bulk_update(
+                changed.values(),
+                INGREDIENT_FIELDS + ('updated_at',),
+                batch_size=1000
+            )
+            update_ingredient_recipes(changed)
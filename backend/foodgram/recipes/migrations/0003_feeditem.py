@@ -0,0 +1,58 @@
+# Generated by Django 3.2 on 2026-10-19 10:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_feed(apps, schema_editor):
+    FeedItem = apps.get_model('recipes', 'FeedItem')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Subscription = apps.get_model('users', 'Subscription')
+    for user_id, author_id in Subscription.objects.values_list(
+            'user_id', 'author_id').iterator():
+        FeedItem.objects.bulk_create(
+            [FeedItem(user_id=user_id, author_id=author_id,
+                      recipe_id=recipe_id)
+             for recipe_id in Recipe.objects.filter(
+                 author_id=author_id).values_list('id', flat=True)],
+            ignore_conflicts=True
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0002_initial'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feeditems', to='recipes.recipe')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feeditems', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Лента',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feeditem',
+            index=models.Index(fields=['user', '-recipe'], name='feeditem_user_recipe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feeditem',
+            index=models.Index(fields=['user', 'author'], name='feeditem_user_author_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feeditem',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique feeditem'),
+        ),
+        migrations.RunPython(backfill_feed, migrations.RunPython.noop),
+    ]
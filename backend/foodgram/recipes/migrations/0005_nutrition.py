@@ -0,0 +1,63 @@
+# Generated by Django 3.2 on 2026-10-19 10:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_similarrecipe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='calories',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='carbohydrates',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='fats',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='proteins',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='calories',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='carbohydrates',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='cost',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='fats',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='proteins',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+# istartswith on PostgreSQL is UPPER("name"::text) LIKE UPPER(...), which
+# the plain b-tree indexes from 0008 cannot serve.
+INDEXES = (
+    ('Recipe', 'recipes_recipe_name_upper_idx'),
+    ('Ingredient', 'recipes_ingredient_name_upper_idx'),
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for model_name, index_name in INDEXES:
+        table = apps.get_model('recipes', model_name)._meta.db_table
+        schema_editor.execute(
+            'CREATE INDEX {} ON {} (UPPER({}::text) text_pattern_ops)'.format(
+                schema_editor.quote_name(index_name),
+                schema_editor.quote_name(table),
+                schema_editor.quote_name('name'),
+            )
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for _, index_name in INDEXES:
+        schema_editor.execute(
+            'DROP INDEX IF EXISTS {}'.format(
+                schema_editor.quote_name(index_name)
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_tag_ingredient_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2 on 2026-10-19 11:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.conf import settings
+from django.db.models import Count
+
+
+def mark_popular(apps, schema_editor):
+    PopularAuthor = apps.get_model('recipes', 'PopularAuthor')
+    Subscription = apps.get_model('users', 'Subscription')
+    authors = Subscription.objects.values('author_id').annotate(
+        followers=Count('id')
+    ).filter(
+        followers__gt=getattr(settings, 'FEED_FANOUT_LIMIT', 1000)
+    ).values_list('author_id', flat=True)
+    PopularAuthor.objects.bulk_create(
+        [PopularAuthor(author_id=author_id) for author_id in authors]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_upper_indexes'),
+        ('recipes', '0010_name_upper_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularAuthor',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='users.user')),
+            ],
+            options={
+                'verbose_name': 'Популярный автор',
+                'verbose_name_plural': 'Популярные авторы',
+            },
+        ),
+        migrations.RunPython(mark_popular, migrations.RunPython.noop),
+    ]
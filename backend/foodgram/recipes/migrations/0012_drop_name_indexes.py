@@ -0,0 +1,26 @@
+# Generated by Django 3.2 on 2026-10-19 11:49
+
+from django.db import migrations, models
+
+# The UPPER() indexes from 0010 serve istartswith; the plain b-tree
+# indexes from 0008 were only extra write cost.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_popularauthor'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ingredient',
+            name='name',
+            field=models.CharField(max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='name',
+            field=models.CharField(max_length=200),
+        ),
+    ]
@@ -12,8 +12,10 @@ class Tag(models.Model):
     name = models.CharField(max_length=64, unique=True)
     color = ColorField(unique=True)
     slug = models.SlugField(max_length=64, unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
+        ordering = ('id',)
         verbose_name = 'Тег'
         verbose_name_plural = 'Теги'
 
@@ -26,6 +28,17 @@ class Ingredient(models.Model):
 
     name = models.CharField(max_length=64)
     measurement_unit = models.CharField(max_length=64)
+    calories = models.FloatField(null=True, blank=True)
+    proteins = models.FloatField(null=True, blank=True)
+    fats = models.FloatField(null=True, blank=True)
+    carbohydrates = models.FloatField(null=True, blank=True)
+    price = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        null=True,
+        blank=True
+    )
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = 'Ингредиент'
@@ -58,6 +71,18 @@ class Recipe(models.Model):
     cooking_time = models.IntegerField(
         validators=(MinValueValidator(1),)
     )
+    calories = models.FloatField(null=True, blank=True, db_index=True)
+    proteins = models.FloatField(null=True, blank=True)
+    fats = models.FloatField(null=True, blank=True)
+    carbohydrates = models.FloatField(null=True, blank=True)
+    cost = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        db_index=True
+    )
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = 'Рецепт'
@@ -140,3 +165,116 @@ class Favorite(models.Model):
 
     def __str__(self):
         return f'{self.user} {self.recipe}'
+
+
+class FeedItem(models.Model):
+    """Запись ленты подписок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feeditems'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feeditems'
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique feeditem'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', '-recipe'),
+                name='feeditem_user_recipe_idx'
+            ),
+            models.Index(
+                fields=('user', 'author'),
+                name='feeditem_user_author_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user} {self.recipe}'
+
+
+class PopularAuthor(models.Model):
+    """Автор с подписчиками сверх FEED_FANOUT_LIMIT.
+
+    Его рецепты не разносятся по лентам, а подмешиваются при чтении.
+    """
+
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+'
+    )
+
+    class Meta:
+        verbose_name = 'Популярный автор'
+        verbose_name_plural = 'Популярные авторы'
+
+    def __str__(self):
+        return f'{self.author}'
+
+
+class SimilarRecipe(models.Model):
+    """Похожий рецепт по совместному добавлению в избранное."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_to'
+    )
+    score = models.FloatField()
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('recipe', 'similar'),
+                name='unique similarrecipe'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('recipe', '-score'),
+                name='similarrecipe_score_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} {self.similar}'
+
+
+class StaleRecipe(models.Model):
+    """Рецепт, избранное которого изменилось после расчёта похожих."""
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+'
+    )
+
+    def __str__(self):
+        return f'{self.recipe_id}'
@@ -0,0 +1,64 @@
+from django.db.models import DecimalField, F, FloatField, Sum
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import IngredientRecipe, Recipe
+
+NUTRITION_FIELDS = ('calories', 'proteins', 'fats', 'carbohydrates')
+INGREDIENT_FIELDS = NUTRITION_FIELDS + ('price',)
+TOTAL_FIELDS = NUTRITION_FIELDS + ('cost',)
+
+totals_updated = Signal()
+
+
+def update_recipe_totals(recipe_ids):
+    """Пересчитывает сохранённые КБЖУ и стоимость рецептов.
+
+    Значения ингредиентов заданы на единицу измерения, поэтому итог
+    рецепта — сумма amount * значение по его ингредиентам. Sum пропускает
+    ингредиенты без значения (NULL): при неполных данных итог занижен, но
+    не отличается от полного, а NULL он равен, только если значения нет
+    ни у одного ингредиента. bulk_update не отправляет post_save, поэтому
+    после него отправляется totals_updated со списком id рецептов.
+    """
+    recipe_ids = set(recipe_ids)
+    if not recipe_ids:
+        return
+    aggregates = {
+        field: Sum(
+            F('amount') * F(f'ingredient__{field}'),
+            output_field=FloatField()
+        )
+        for field in NUTRITION_FIELDS
+    }
+    aggregates['cost'] = Sum(
+        F('amount') * F('ingredient__price'),
+        output_field=DecimalField(max_digits=12, decimal_places=2)
+    )
+    totals = {
+        row.pop('recipe_id'): row
+        for row in IngredientRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values('recipe_id').annotate(**aggregates).order_by()
+    }
+    recipes = list(Recipe.objects.filter(id__in=recipe_ids).only('id'))
+    now = timezone.now()
+    for recipe in recipes:
+        row = totals.get(recipe.id, {})
+        for field in TOTAL_FIELDS:
+            setattr(recipe, field, row.get(field))
+        recipe.updated_at = now
+    Recipe.objects.bulk_update(
+        recipes, TOTAL_FIELDS + ('updated_at',), batch_size=1000
+    )
+    totals_updated.send(
+        sender=Recipe, pks=[recipe.id for recipe in recipes]
+    )
+
+
+def update_ingredient_recipes(ingredient_ids):
+    update_recipe_totals(
+        IngredientRecipe.objects.filter(
+            ingredient_id__in=ingredient_ids
+        ).values_list('recipe_id', flat=True).distinct()
+    )
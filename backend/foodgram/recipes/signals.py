@@ -0,0 +1,104 @@
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+from users.models import Subscription
+
+from . import index
+from .deletion import delete_orphaned_images, pre_bulk_delete
+from .feed import backfill_feed, drop_feed, fanout_recipe, update_popularity
+from .models import Favorite, Ingredient, Recipe
+from .nutrition import INGREDIENT_FIELDS, update_ingredient_recipes
+from .similarity import mark_stale
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        fanout_recipe(instance)
+        index.invalidate(author_ids=[instance.author_id])
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_created(sender, instance, created, **kwargs):
+    if created:
+        update_popularity(instance.author_id)
+        backfill_feed(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_deleted(sender, instance, **kwargs):
+    drop_feed(instance.user_id, instance.author_id)
+    update_popularity(instance.author_id)
+
+
+@receiver(pre_bulk_delete, sender=Subscription)
+def subscriptions_bulk_deleted(sender, pks, **kwargs):
+    author_ids = set(Subscription.objects.filter(pk__in=pks).values_list(
+        'author_id', flat=True
+    ))
+
+    def update():
+        for author_id in author_ids:
+            update_popularity(author_id)
+
+    transaction.on_commit(update)
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_created(sender, instance, created, **kwargs):
+    if created:
+        mark_stale([instance.recipe_id])
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, **kwargs):
+    mark_stale([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(sender, instance, created, update_fields, **kwargs):
+    if created:
+        return
+    if update_fields and not set(update_fields) & set(INGREDIENT_FIELDS):
+        return
+    update_ingredient_recipes([instance.id])
+
+
+@receiver(pre_bulk_delete, sender=Recipe)
+def recipes_bulk_deleted(sender, pks, **kwargs):
+    names = list(
+        Recipe.objects.filter(pk__in=pks).values_list('image', flat=True)
+    )
+    transaction.on_commit(lambda: delete_orphaned_images(names))
+    index.invalidate_recipe_ids(pks)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    index.invalidate_recipe_ids([instance.pk])
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_author_changed(sender, instance, **kwargs):
+    if instance._state.adding or not index.is_enabled():
+        return
+    old_author_id = Recipe.objects.filter(pk=instance.pk).values_list(
+        'author_id', flat=True
+    ).first()
+    if old_author_id not in (None, instance.author_id):
+        index.invalidate(author_ids=[old_author_id, instance.author_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if reverse:
+        if action.startswith('post_'):
+            index.invalidate(tag_ids=[instance.pk])
+    elif action == 'pre_clear':
+        index.invalidate(
+            tag_ids=instance.tags.values_list('id', flat=True)
+        )
+    elif action in ('post_add', 'post_remove'):
+        index.invalidate(tag_ids=pk_set)
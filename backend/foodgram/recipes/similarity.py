@@ -0,0 +1,125 @@
+import math
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Favorite, Recipe, SimilarRecipe, StaleRecipe
+
+
+def get_top_k():
+    return getattr(settings, 'SIMILAR_RECIPES_TOP_K', 10)
+
+
+def mark_stale(recipe_ids):
+    StaleRecipe.objects.bulk_create(
+        [StaleRecipe(recipe_id=recipe_id) for recipe_id in recipe_ids],
+        ignore_conflicts=True
+    )
+
+
+def get_affected_recipes(stale_ids):
+    """Рецепты, чей список похожих мог измениться.
+
+    Косинусная мера пары меняется, только если в паре есть рецепт
+    с изменившимся избранным, поэтому пересчитываются сами такие
+    рецепты, рецепты, у которых они уже в списке похожих, и рецепты,
+    которые с ними сейчас вместе в избранном.
+    """
+    users = Favorite.objects.filter(
+        recipe_id__in=stale_ids
+    ).values('user_id')
+    affected = set(stale_ids)
+    affected.update(SimilarRecipe.objects.filter(
+        similar_id__in=stale_ids
+    ).values_list('recipe_id', flat=True))
+    affected.update(Favorite.objects.filter(
+        user_id__in=users
+    ).values_list('recipe_id', flat=True))
+    return affected
+
+
+def compute_similar(recipe_ids=None, top_k=None):
+    """Считает top-K похожих рецептов по матрице совместного избранного.
+
+    Матрица пользователь x рецепт хранится разреженно: для каждого
+    пользователя множество рецептов в избранном. Совместная встречаемость
+    (X^T X) накапливается только по ненулевым парам.
+    """
+    top_k = top_k or get_top_k()
+    favorites = Favorite.objects.all()
+    if recipe_ids is not None:
+        favorites = favorites.filter(
+            user_id__in=Favorite.objects.filter(
+                recipe_id__in=recipe_ids
+            ).values('user_id')
+        )
+    baskets = defaultdict(set)
+    for user_id, recipe_id in favorites.values_list(
+            'user_id', 'recipe_id').iterator(chunk_size=10000):
+        baskets[user_id].add(recipe_id)
+
+    cooccurrence = defaultdict(Counter)
+    for basket in baskets.values():
+        targets = basket if recipe_ids is None else basket & recipe_ids
+        for recipe_id in targets:
+            row = cooccurrence[recipe_id]
+            for other_id in basket:
+                if other_id != recipe_id:
+                    row[other_id] += 1
+
+    involved = set(cooccurrence)
+    for row in cooccurrence.values():
+        involved.update(row)
+    popularity = dict(
+        Favorite.objects.filter(recipe_id__in=involved).values(
+            'recipe_id'
+        ).annotate(total=Count('id')).values_list('recipe_id', 'total')
+    )
+
+    result = {}
+    for recipe_id, row in cooccurrence.items():
+        norm = popularity.get(recipe_id, 0)
+        scores = [
+            (other_id, count / math.sqrt(norm * popularity[other_id]))
+            for other_id, count in row.items()
+            if norm and popularity.get(other_id)
+        ]
+        scores.sort(key=lambda item: (-item[1], item[0]))
+        result[recipe_id] = scores[:top_k]
+    return result
+
+
+def refresh_similar(full=False, top_k=None):
+    """Обновляет таблицу похожих рецептов, возвращает число пересчитанных.
+
+    Отметки StaleRecipe удаляются в начале той же транзакции: рецепт,
+    отмеченный во время расчёта, останется отмеченным до следующего
+    запуска.
+    """
+    with transaction.atomic():
+        if full:
+            StaleRecipe.objects.all().delete()
+            neighbours = compute_similar(top_k=top_k)
+            SimilarRecipe.objects.all().delete()
+            count = Recipe.objects.count()
+        else:
+            stale_ids = set(
+                StaleRecipe.objects.values_list('recipe_id', flat=True)
+            )
+            if not stale_ids:
+                return 0
+            StaleRecipe.objects.filter(recipe_id__in=stale_ids).delete()
+            affected = get_affected_recipes(stale_ids)
+            neighbours = compute_similar(affected, top_k=top_k)
+            SimilarRecipe.objects.filter(recipe_id__in=affected).delete()
+            count = len(affected)
+        SimilarRecipe.objects.bulk_create(
+            [SimilarRecipe(recipe_id=recipe_id, similar_id=other_id,
+                           score=score)
+             for recipe_id, scores in neighbours.items()
+             for other_id, score in scores],
+            batch_size=1000
+        )
+    return count
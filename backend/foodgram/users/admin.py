@@ -1,10 +1,12 @@
 from django.contrib import admin
+from foodgram.paginator import EstimatedCountPaginator
+from recipes.admin import BulkDeleteMixin
 
 from .models import User
 
 
 @admin.register(User)
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(BulkDeleteMixin, admin.ModelAdmin):
     list_display = [
         'email',
         'username',
@@ -14,4 +16,8 @@ class UserAdmin(admin.ModelAdmin):
         'is_superuser',
         'is_active'
     ]
-    list_filter = ['email', 'username']
+    list_filter = ['is_staff', 'is_superuser', 'is_active']
+    search_fields = ['^email', '^username']
+    ordering = ['id']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
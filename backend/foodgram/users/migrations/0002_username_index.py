@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-19 10:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='username',
+            field=models.CharField(db_index=True, max_length=150, verbose_name='Имя пользователя'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+# istartswith on PostgreSQL is UPPER("field"::text) LIKE UPPER(...), which
+# the unique and plain b-tree indexes cannot serve.
+INDEXES = (
+    ('email', 'users_user_email_upper_idx'),
+    ('username', 'users_user_username_upper_idx'),
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    table = apps.get_model('users', 'User')._meta.db_table
+    for field, index_name in INDEXES:
+        schema_editor.execute(
+            'CREATE INDEX {} ON {} (UPPER({}::text) text_pattern_ops)'.format(
+                schema_editor.quote_name(index_name),
+                schema_editor.quote_name(table),
+                schema_editor.quote_name(field),
+            )
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for _, index_name in INDEXES:
+        schema_editor.execute(
+            'DROP INDEX IF EXISTS {}'.format(
+                schema_editor.quote_name(index_name)
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_username_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2 on 2026-10-19 11:49
+
+from django.db import migrations, models
+
+# The UPPER() index from 0003 serves istartswith; the plain b-tree
+# index from 0002 was only extra write cost.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_upper_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='username',
+            field=models.CharField(max_length=150, verbose_name='Имя пользователя'),
+        ),
+    ]